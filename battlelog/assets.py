@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageFont
+
+
+class AssetAtlas:
+    """Decoded images and fonts shared by every render.
+
+    Images are decoded once and kept scaled to the size they are pasted at,
+    so renders only composite. Cached images are shared between the render
+    threads and must never be closed or modified by callers.
+
+    Card images are large once decoded, so only the most recently used
+    ``max_cards`` of them are kept.
+    """
+
+    def __init__(self, data_path, max_cards=40):
+        self.data_path = data_path
+        self.max_cards = max_cards
+        self._lock = threading.Lock()
+        self._images = {}
+        self._cards = OrderedDict()
+        self._fonts = {}
+
+    def _load(self, path, size=None, height=None):
+        image = Image.open(str(path))
+        image.load()
+        if height is not None:
+            resize_factor = height / image.height
+            size = (int(image.width * resize_factor), int(image.height * resize_factor))
+        if size is not None and size != image.size:
+            resized = image.resize(size)
+            image.close()
+            image = resized
+        return image
+
+    def image(self, *parts, size=None, height=None):
+        """Image under img/, resized to size or scaled to height."""
+        key = (parts, size, height)
+        with self._lock:
+            image = self._images.get(key)
+        if image is None:
+            image = self._load(
+                self.data_path.joinpath("img", *parts), size=size, height=height
+            )
+            with self._lock:
+                image = self._images.setdefault(key, image)
+        return image
+
+    def card(self, key, size):
+        """Card image resized to size."""
+        cache_key = (key, size)
+        with self._lock:
+            image = self._cards.get(cache_key)
+            if image is not None:
+                self._cards.move_to_end(cache_key)
+                return image
+        image = self._load(
+            self.data_path / "img" / "cards" / "{}.png".format(key), size=size
+        )
+        with self._lock:
+            self._cards[cache_key] = image
+            while len(self._cards) > self.max_cards:
+                # Evicted images may still be pasted by another render, let
+                # the garbage collector free them instead of closing them
+                self._cards.popitem(last=False)
+        return image
+
+    def font(self, name, size):
+        key = (name, size)
+        with self._lock:
+            font = self._fonts.get(key)
+        if font is None:
+            font = ImageFont.truetype(
+                str(self.data_path / "fonts" / name), size=size
+            )
+            with self._lock:
+                font = self._fonts.setdefault(key, font)
+        return font
@@ -23,7 +23,7 @@ import yaml
 from discord import team
 from discord.ext.commands import Converter
 from discord.ext.commands.errors import BadArgument
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from pympler import asizeof
 from redbot.core import Config, checks, commands
 from redbot.core.data_manager import bundled_data_path, cog_data_path
@@ -32,13 +32,14 @@ from redbot.core.utils.chat_formatting import pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu, start_adding_reactions
 from redbot.core.utils.predicates import MessagePredicate, ReactionPredicate
 
+from .assets import AssetAtlas
+
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
 
 credits = "Bot by Legend Gaming"
 credits_icon = "https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1"
 log = logging.getLogger("red.cogs.battlelog")
 
-update_files = True
 DEBUG = True
 
 CARDS_JSON_PATH: str = ""
@@ -107,6 +108,13 @@ async def simple_embed(
 class BattleLog(commands.Cog):
     """Clash Royale Deck Builder."""
 
+    battle_logo_map = {
+        "1v1": "1v1_battle.png",
+        "CW_Battle": "cw_battle_1v1.png",
+        "CW_Duel": "cw_battle_duel.png",
+        "2v2": "2v2_battle.png",
+    }
+
     def __init__(self, bot):
         """Init."""
         self.bot = bot
@@ -153,6 +161,9 @@ class BattleLog(commands.Cog):
 
         # Used for Pillow blocking code
         self.threadex = ThreadPoolExecutor(max_workers=4)
+        # Decoded images and fonts shared by all renders
+        self.assets = AssetAtlas(bundled_data_path(self))
+        self.threadex.submit(self.preload_assets)
 
         self.emoji = BotEmoji(self.bot)
         self.single_duel_image = False
@@ -178,6 +189,18 @@ class BattleLog(commands.Cog):
         if self.clash:
             self.bot.loop.create_task(self.clash.close())
 
+    def preload_assets(self):
+        """Decode the images and fonts used by every render ahead of time."""
+        for battle_logo in self.battle_logo_map.values():
+            self.assets.image(
+                battle_logo, height=self.card_info["battle_logo_displacement"]
+            )
+        for elixir in ("elixir.png", "elixir-cycle.png"):
+            self.assets.image(elixir, height=self.card_info["line_height"])
+        for font in ("OpenSans-Regular.ttf", "OpenSans-Bold.ttf"):
+            self.assets.font(font, self.card_info["font_size"])
+            self.assets.font(font, self.card_info["font_size_large"])
+
     async def red_delete_data_for_user(self, *, requester: RequestType, user_id: int) -> None:
         super().red_delete_data_for_user(requester=requester, user_id=user_id)
 
@@ -200,7 +223,7 @@ class BattleLog(commands.Cog):
         if isinstance(member, discord.member.Member) or isinstance(
             member, discord.Member
         ):
-            player_tag = self.tags.getTag(member.id, account)
+            player_tag = await self.tags.getTag(member.id, account)
         elif isinstance(member, str):
             player_tag = member
 
@@ -443,11 +466,6 @@ class BattleLog(commands.Cog):
         deck1 = player1["deck"]
         deck2 = player2["deck"]
 
-        font_file_regular = str(
-            bundled_data_path(self) / "fonts" / "OpenSans-Regular.ttf"
-        )
-        font_file_bold = str(bundled_data_path(self) / "fonts/OpenSans-Bold.ttf")
-
         size = (
             column2_offset * 2,
             int(
@@ -461,56 +479,25 @@ class BattleLog(commands.Cog):
         print(size)
         image = Image.new("RGBA", size)
 
-        bg_image_file = str(bundled_data_path(self) / "img" / "double_size_no_logo.png")
-        bg_image = Image.open(bg_image_file)
-        bg_image = bg_image.resize(size)
-        if update_files and size != bg_image.size:
-            bg_image = bg_image.resize(size)
-            bg_image.save(bg_image_file)
+        bg_image = self.assets.image("double_size_no_logo.png", size=size)
         image.paste(bg_image)
-        bg_image.close()
 
         # battle logo is centred and y offset is height of score image
-        battle_logo_map = {
-            "1v1": "1v1_battle.png",
-            "CW_Battle": "cw_battle_1v1.png",
-            "CW_Duel": "cw_battle_duel.png",
-            "2v2": "2v2_battle.png",
-        }
-        battle_logo_file = str(
-            bundled_data_path(self)
-            / "img"
-            / battle_logo_map.get(battle_type, "1v1_battle.png")
+        battle_logo = self.assets.image(
+            self.battle_logo_map.get(battle_type, "1v1_battle.png"),
+            height=battle_logo_displacement,
         )
-        battle_logo = Image.open(battle_logo_file)
-        resize_factor = battle_logo_displacement / battle_logo.height
-        battle_logo_size = (
-            int(battle_logo.width * resize_factor),
-            int(battle_logo.height * resize_factor),
-        )
-        if update_files and battle_logo_size != battle_logo.size:
-            battle_logo = battle_logo.resize(battle_logo_size)
-            battle_logo.save(battle_logo_file)
+        battle_logo_size = battle_logo.size
         box = (
             int(column2_offset - battle_logo.width / 2),
             score_displacement,
         )
         image.paste(battle_logo, box)
-        battle_logo.close()
 
         # score image is centred and y offset is 0. height of image is
-        score_image_file = str(
-            bundled_data_path(self) / "img" / "score" / "{}.png".format(battle_score)
-        )
-        score_image = Image.open(score_image_file)
-        resize_factor = score_displacement / score_image.height
-        score_image_size = (
-            int(score_image.width * resize_factor),
-            int(score_image.height * resize_factor),
+        score_image = self.assets.image(
+            "score", "{}.png".format(battle_score), height=score_displacement
         )
-        if update_files and score_image_size != score_image.size:
-            score_image = score_image.resize(score_image_size)
-            score_image.save(score_image_file)
         box = (
             int(column2_offset - score_image.width / 2),
             0,
@@ -529,10 +516,10 @@ class BattleLog(commands.Cog):
         deck1_image.close()
 
         # draw vertical line at center
-        font_regular = ImageFont.truetype(font_file_regular, size=font_size)
-        font_large = ImageFont.truetype(font_file_regular, size=font_size_large)
-        font_bold = ImageFont.truetype(font_file_bold, size=font_size)
-        font_large_bold = ImageFont.truetype(font_file_bold, size=font_size_large)
+        font_regular = self.assets.font("OpenSans-Regular.ttf", font_size)
+        font_large = self.assets.font("OpenSans-Regular.ttf", font_size_large)
+        font_bold = self.assets.font("OpenSans-Bold.ttf", font_size)
+        font_large_bold = self.assets.font("OpenSans-Bold.ttf", font_size_large)
         d = ImageDraw.Draw(image)
         d.line(
             (
@@ -575,30 +562,14 @@ class BattleLog(commands.Cog):
                 font=font_regular,
                 fill=(0xFF, 0xFF, 0xFF, 255),
             )
-        elixir_image = Image.open(str(bundled_data_path(self) / "img" / "elixir.png"))
-        resize_factor = line_height / elixir_image.height
-        elixir_image = elixir_image.resize(
-            (
-                int(elixir_image.width * resize_factor),
-                int(elixir_image.height * resize_factor),
-            )
-        )
+        elixir_image = self.assets.image("elixir.png", height=line_height)
         box = (
             card_x,
             txt_y_line1,
         )
         image.paste(elixir_image, box)
 
-        cycle_elixir_image = Image.open(
-            str(bundled_data_path(self) / "img" / "elixir-cycle.png")
-        )
-        resize_factor = line_height / cycle_elixir_image.height
-        cycle_elixir_image = cycle_elixir_image.resize(
-            (
-                int(cycle_elixir_image.width * resize_factor),
-                int(cycle_elixir_image.height * resize_factor),
-            )
-        )
+        cycle_elixir_image = self.assets.image("elixir-cycle.png", height=line_height)
         box = (
             card_x,
             txt_y_line2,
@@ -699,17 +670,7 @@ class BattleLog(commands.Cog):
         )
         image = Image.new("RGBA", size)
         for i, card in enumerate(deck1):
-            card_image_file = str(
-                bundled_data_path(self) / "img" / "cards" / "{}.png".format(card)
-            )
-            card_image = Image.open(card_image_file)
-            card_image_size = (
-                card_w,
-                card_h,
-            )
-            if update_files and card_image_size != card_image.size:
-                card_image = card_image.resize(card_image_size)
-                card_image.save(card_image_file)
+            card_image = self.assets.card(card, (card_w, card_h))
             top_left_corner = (
                 card_x + card_w * (i) if single_line else card_w * (i % 4),
                 card_y + card_h if single_line else card_h * int(i / 4),
@@ -721,7 +682,6 @@ class BattleLog(commands.Cog):
                 top_left_corner[1] + card_h,
             )
             image.paste(card_image, box, card_image)
-            card_image.close()
         image.thumbnail(size)
         return image
 
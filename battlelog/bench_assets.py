@@ -0,0 +1,124 @@
+"""Benchmark of battlelog renders with and without the AssetAtlas.
+
+Composites the images of a 25 battle battlelog the way get_1v1_deck_image
+does, once opening and resizing every image from disk per render like
+before and once through an AssetAtlas. Each runs in its own process so the
+peak RSS of one does not hide the other. Needs Pillow but neither Red nor
+discord:
+
+    python battlelog/bench_assets.py
+"""
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+from assets import AssetAtlas
+
+BATTLES = 25
+RUNS = 3
+data_path = Path(__file__).parent / "data"
+# Same sizes as BattleLog.card_info
+card_w, card_h = 604, 726
+card_x, card_y = 30, 30
+font_size, font_size_large = 160, 170
+battle_logo_displacement = 500
+score_displacement = 250
+line_height = 250
+column2_offset = card_x * 2 + card_w * 4 + 20
+
+
+class DiskAssets:
+    """Decodes and resizes every image on each use, like renders did before"""
+
+    def __init__(self, data_path):
+        self.atlas = AssetAtlas(data_path)
+
+    def image(self, *parts, size=None, height=None):
+        return self.atlas._load(
+            self.atlas.data_path.joinpath("img", *parts), size=size, height=height
+        )
+
+    def card(self, key, size):
+        return self.atlas._load(
+            self.atlas.data_path / "img" / "cards" / "{}.png".format(key), size=size
+        )
+
+    def font(self, name, size):
+        return ImageFont.truetype(str(self.atlas.data_path / "fonts" / name), size=size)
+
+
+def deck_image(assets, deck):
+    image = Image.new("RGBA", (card_w * 4, card_h * 2))
+    for i, card in enumerate(deck):
+        card_image = assets.card(card, (card_w, card_h))
+        corner = (card_w * (i % 4), card_h * int(i / 4))
+        image.paste(card_image, corner + (corner[0] + card_w, corner[1] + card_h), card_image)
+    return image
+
+
+def render(assets, deck1, deck2, score):
+    size = (
+        column2_offset * 2,
+        score_displacement + battle_logo_displacement + card_y + card_h * 2 + line_height * 2,
+    )
+    image = Image.new("RGBA", size)
+    image.paste(assets.image("double_size_no_logo.png", size=size))
+    battle_logo = assets.image("1v1_battle.png", height=battle_logo_displacement)
+    image.paste(battle_logo, (int(column2_offset - battle_logo.width / 2), score_displacement))
+    score_image = assets.image("score", "{}.png".format(score), height=score_displacement)
+    image.paste(score_image, (int(column2_offset - score_image.width / 2), 0))
+    d = ImageDraw.Draw(image)
+    font_bold = assets.font("OpenSans-Bold.ttf", font_size)
+    font_large_bold = assets.font("OpenSans-Bold.ttf", font_size_large)
+    assets.font("OpenSans-Regular.ttf", font_size)
+    assets.font("OpenSans-Regular.ttf", font_size_large)
+    txt_y_line1 = score_displacement + battle_logo_displacement + card_y + card_h * 2
+    for offset, deck in ((0, deck1), (column2_offset, deck2)):
+        deck_img = deck_image(assets, deck)
+        top = score_displacement + battle_logo_displacement
+        image.paste(deck_img, (offset, top, offset + deck_img.width, top + deck_img.height), deck_img)
+        d.text((offset + card_x, card_y), "Player (#2PP)", font=font_large_bold)
+        d.text((offset + 400, txt_y_line1), "3.500", font=font_bold)
+        image.paste(assets.image("elixir.png", height=line_height), (offset + card_x, txt_y_line1))
+        image.paste(
+            assets.image("elixir-cycle.png", height=line_height),
+            (offset + card_x, txt_y_line1 + line_height),
+        )
+    image.thumbnail(tuple(x * 0.5 for x in image.size))
+    return image
+
+
+def run(mode):
+    rng = random.Random(0)
+    cards = sorted(path.stem for path in (data_path / "img" / "cards").glob("*.png"))
+    battles = [
+        (rng.sample(cards, 8), rng.sample(cards, 8), "{}-{}".format(rng.randint(0, 3), rng.randint(0, 3)))
+        for _ in range(BATTLES * RUNS)
+    ]
+    assets = AssetAtlas(data_path) if mode == "atlas" else DiskAssets(data_path)
+    start = time.perf_counter()
+    for deck1, deck2, score in battles:
+        render(assets, deck1, deck2, score).close()
+    elapsed = time.perf_counter() - start
+    # Kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        "{}: {:.2f}s per battlelog, peak RSS {:.0f} MB".format(mode, elapsed / RUNS, peak)
+    )
+
+
+def main():
+    for mode in ("disk", "atlas"):
+        subprocess.run([sys.executable, __file__, mode], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        main()
@@ -1,5 +1,6 @@
+import asyncio
 import logging
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import discord
 from redbot.core.bot import Red
@@ -7,6 +8,11 @@ from redbot.core import Config, checks, commands
 
 log = logging.getLogger("red.cogs.clanlog")
 
+# Seconds log entries are collected for before they are posted together
+flush_delay = 5
+# Embed description limit
+description_limit = 2048
+
 
 class NoClansCog(Exception):
     pass
@@ -22,6 +28,10 @@ class ClanLog(commands.Cog):
         }
         self.config.register_global(**default_global)
 
+        # channel id -> [(embed title, entry)] waiting to be posted
+        self.pending: Dict[int, List[Tuple[str, str]]] = {}
+        self.flush_task = None
+
         try:
             # for auto-completion :)
             from clashroyaleclansv2 import ClashRoyaleClans2
@@ -32,109 +42,119 @@ class ClanLog(commands.Cog):
         except:
             pass
 
-    @commands.Cog.listener(name="on_clandata_update")
-    async def on_clandata_update(self, old_data, new_data):
-        def get_role_hierarchy(role):
-            hierarchy = {"member": 1, "elder": 2, "coleader": 3, "leader": 4}
-            if role.lower() not in hierarchy.keys():
-                log.error(f"Cannot find hierarchy for role {role.lower() or 'None'}")
-                return 0
-            return hierarchy[role.lower()]
+    def cog_unload(self):
+        if self.flush_task and not self.flush_task.done():
+            # A batch being posted is shielded and finishes on its own
+            self.flush_task.cancel()
+        if self.pending:
+            # Post what is still queued instead of dropping it
+            self.bot.loop.create_task(self.flush())
+
+    def queue(self, channels, title: str, entries: List[str]):
+        """Queue log entries for the channels, they are posted by the next flush"""
+        for channel in channels:
+            if channel is None:
+                continue
+            self.pending.setdefault(channel.id, []).extend((title, entry) for entry in entries)
+        if self.pending and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = self.bot.loop.create_task(self.flush_later())
+
+    async def flush_later(self):
+        # Entries queued while a batch is being posted go out with the next one
+        while self.pending:
+            await asyncio.sleep(flush_delay)
+            await asyncio.shield(self.flush())
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        results = await asyncio.gather(
+            *(self.post(channel_id, entries) for channel_id, entries in pending.items()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                log.error(f"Failed to post clan log: {result}")
+
+    @staticmethod
+    def pack(entries: List[Tuple[str, str]]) -> List[discord.Embed]:
+        """Fewest embeds holding the entries, one or more per title"""
+        by_title: Dict[str, List[str]] = {}
+        for title, entry in entries:
+            by_title.setdefault(title, []).append(entry)
+        embeds = []
+        for title, title_entries in by_title.items():
+            description = ""
+            for entry in title_entries:
+                entry = entry[:description_limit]
+                if len(description) + len(entry) > description_limit:
+                    embeds.append(discord.Embed(title=title, description=description, colour=discord.Colour.blue()))
+                    description = ""
+                description += entry
+            if description:
+                embeds.append(discord.Embed(title=title, description=description, colour=discord.Colour.blue()))
+        return embeds
 
+    async def post(self, channel_id: int, entries: List[Tuple[str, str]]):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        # Messages to one channel are sent in order, discord.py waits out
+        # the channel's rate limit between them
+        for embed in self.pack(entries):
+            await channel.send(embed=embed)
+
+    @commands.Cog.listener(name="on_clandata_update")
+    async def on_clandata_update(self, changes):
+        """changes maps clan keys to the ClanChanges computed by ClashRoyaleClans2"""
         log_channel_id = await self.config.global_log_channel()
         log_channel = self.bot.get_channel(log_channel_id)
         if log_channel is None:
             log.error("Global log channel is not setup correctly.")
             return
 
-        # old_data = kwargs.get("old_data")
-        # new_data = kwargs.get("new_data")
-        if len(old_data) == 0 or old_data is None:
-                log.error("Old data is " + old_data)
-                return
-        if len(new_data) == 0 or new_data is None:
-                log.error("New data is " + new_data)
-                return
-        for key, data in new_data.items():
+        for key, clan in changes.items():
+            if not (clan.joined or clan.left or clan.promoted or clan.demoted):
+                continue
             clan_log_channel = self.crclans.get_static_clandata(key).get("log_channel", None)
             if clan_log_channel:
                 clan_log_channel = self.bot.get_channel(clan_log_channel)
 
-            old_members_data = {}
-            new_members_data = {}
-            # When a clan is added
-            if key not in old_data.keys():
-                log.error(f"Clan {key} not found in old_data.")
-                continue
-            for member_data in old_data[key]["member_list"]:
-                old_members_data[member_data["tag"]] = member_data
-            for member_data in data["member_list"]:
-                new_members_data[member_data["tag"]] = member_data
+            channels = (log_channel, clan_log_channel)
 
             # Process promotions and demotions
-            common_members = set(old_members_data.keys()).intersection(new_members_data.keys())
-            description = ""
-            for member in common_members:
-                old_role = old_members_data[member].get("role", "")
-                old_role_index = get_role_hierarchy(old_role)
-                new_role = new_members_data[member].get("role", "")
-                new_role_index = get_role_hierarchy(new_role)
-                if old_role_index == new_role_index:
-                    continue
-                if old_role_index > new_role_index:
-                    description += f"Demotion: {old_role} ⇒ {new_role}\n"
-                if old_role_index < new_role_index:
-                    description += f"Promotion: {old_role} ⇒ {new_role}\n"
-                description += f"{old_members_data[member]['name']} ({old_members_data[member]['tag']})\n"
-            if description:
-                embed = discord.Embed(
-                    title="Member Edited {data['name']} ({data['tag']})",
-                    description=description,
-                    colour=discord.Colour.blue(),
+            entries = []
+            for change in clan.demoted:
+                entries.append(
+                    f"Demotion: {change.old_role} ⇒ {change.new_role}\n"
+                    f"{change.member['name']} ({change.member['tag']})\n"
                 )
-                await log_channel.send(embed=embed)
-                if clan_log_channel:
-                    await clan_log_channel.send(embed=embed)
+            for change in clan.promoted:
+                entries.append(
+                    f"Promotion: {change.old_role} ⇒ {change.new_role}\n"
+                    f"{change.member['name']} ({change.member['tag']})\n"
+                )
+            if entries:
+                self.queue(channels, f"Member Edited {clan.name} ({clan.tag})", entries)
 
             # Process members data
-            total = set(list(new_members_data.keys())).union(
-                set(list(old_members_data.keys()))
-            )
-            players_left_clan = set(total - set(new_members_data.keys()))
-            players_joined_clan = set(total - set(old_members_data.keys()))
-
-            description = ""
-            for player_tag in players_left_clan:
-                player_name = old_members_data.get(player_tag, {}).get("name", "Unnamed Player")
-                sad_emote = self.bot.get_emoji(592001717311242241) or ""
-                description += "{}({}) has left {} {}\n".format(
-                    player_name, player_tag, data["name"], sad_emote
+            sad_emote = self.bot.get_emoji(592001717311242241) or ""
+            entries = [
+                "{}({}) has left {} {}\n".format(
+                    member.get("name", "Unnamed Player"), member["tag"], clan.name, sad_emote
                 )
-            if description:
-                embed = discord.Embed(
-                    title="Member Left",
-                    description=description,
-                    colour=discord.Colour.blue(),
-                )
-                await log_channel.send(embed=embed)
-                if clan_log_channel:
-                    await clan_log_channel.send(embed=embed)
-            description = ""
-            for player_tag in players_joined_clan:
-                player_name = new_members_data.get(player_tag, {}).get("name", "Unnamed Player")
-                happy_emote = self.bot.get_emoji(375143193630605332) or ""
-                description += "{}({}) has joined {} {}\n".format(
-                    player_name, player_tag, key, happy_emote
-                )
-            if description:
-                embed = discord.Embed(
-                    title="Member Joined",
-                    description=description,
-                    colour=discord.Colour.blue(),
+                for member in clan.left
+            ]
+            if entries:
+                self.queue(channels, "Member Left", entries)
+            happy_emote = self.bot.get_emoji(375143193630605332) or ""
+            entries = [
+                "{}({}) has joined {} {}\n".format(
+                    member.get("name", "Unnamed Player"), member["tag"], key, happy_emote
                 )
-                await log_channel.send(embed=embed)
-                if clan_log_channel:
-                    await clan_log_channel.send(embed=embed)
+                for member in clan.joined
+            ]
+            if entries:
+                self.queue(channels, "Member Joined", entries)
 
     @commands.group(name="clanlogset")
     async def clanlogset(self, ctx):
@@ -0,0 +1,78 @@
+"""Benchmark of diff_clans on family sized clan data.
+
+Needs neither Red nor discord:
+
+    python clashroyaleclansv2/bench_clandiff.py
+"""
+import copy
+import random
+import time
+
+from clandiff import diff_clans
+
+CLANS = 16
+MEMBERS = 50
+RUNS = 200
+ROLES = ["member", "elder", "coLeader", "leader"]
+
+
+def make_clans(rng):
+    clans = {}
+    for c in range(CLANS):
+        clans["clan {}".format(c)] = {
+            "name": "Clan {}".format(c),
+            "tag": "#C{}".format(c),
+            "clan_score": 50000,
+            "clan_war_trophies": 3000,
+            "required_trophies": 5000,
+            "members": MEMBERS,
+            "member_list": [
+                {
+                    "tag": "#P{}x{}".format(c, m),
+                    "name": "Player {}".format(m),
+                    "role": rng.choice(ROLES),
+                    "trophies": rng.randint(5000, 7000),
+                    "donations": rng.randint(0, 500),
+                    "donations_received": rng.randint(0, 500),
+                    "exp_level": 13,
+                }
+                for m in range(MEMBERS)
+            ],
+        }
+    return clans
+
+
+def churn(rng, clans):
+    """A refresh worth of changes: donations, a join, a leave and a promotion per clan"""
+    clans = copy.deepcopy(clans)
+    for key, clan in clans.items():
+        for member in clan["member_list"]:
+            member["donations"] += rng.randint(0, 10)
+        clan["member_list"].pop(0)
+        clan["member_list"].append({"tag": "#new-{}".format(key), "name": "New", "role": "member"})
+        clan["member_list"][0]["role"] = "coLeader"
+    return clans
+
+
+def main():
+    rng = random.Random(0)
+    old = make_clans(rng)
+    new = churn(rng, old)
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        changes = diff_clans(old, new)
+    elapsed = time.perf_counter() - start
+    print("changed clans: {}".format(len(changes)))
+    print("diff_clans: {:.3f}ms per refresh".format(elapsed / RUNS * 1000))
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        copy.deepcopy(old)
+        copy.deepcopy(new)
+    elapsed = time.perf_counter() - start
+    print("the two deepcopies it replaces: {:.3f}ms per refresh".format(elapsed / RUNS * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark of the clan refresh against a local fake Clash Royale API.
+
+Starts an HTTP server on localhost that answers every clan after LATENCY
+seconds and times a refresh as the number of clans grows. Needs aiohttp
+but neither Red nor the API:
+
+    python clashroyaleclansv2/bench_refresh.py
+"""
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from refresh import fetch_all
+
+CLAN_COUNTS = (4, 8, 16, 32, 64)
+LATENCY = 0.1
+# The refresh_concurrency default before and after it was raised
+CONCURRENCIES = (8, 32)
+TIMEOUT = 1
+
+
+class FakeServer:
+    """Answers /clans/<tag> after LATENCY seconds, the "slow" clan never answers."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    async def get_clan(self, request):
+        tag = request.match_info["tag"]
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(3600 if tag == "slow" else LATENCY)
+            return web.json_response({"tag": tag})
+        finally:
+            self.active -= 1
+
+
+async def main():
+    server = FakeServer()
+    app = web.Application()
+    app.router.add_get("/clans/{tag}", server.get_clan)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    async with aiohttp.ClientSession() as session:
+
+        async def get_clan(tag):
+            async with session.get("http://127.0.0.1:{}/clans/{}".format(port, tag)) as resp:
+                return await resp.json()
+
+        print("clans  serial  " + "  ".join("at most {:<2}".format(c) for c in CONCURRENCIES))
+        for count in CLAN_COUNTS:
+            tags = {"clan {}".format(i): str(i) for i in range(count)}
+            start = time.perf_counter()
+            for tag in tags.values():
+                await get_clan(tag)
+            line = "{:>5}  {:>5.2f}s".format(count, time.perf_counter() - start)
+            for concurrency in CONCURRENCIES:
+                start = time.perf_counter()
+                await fetch_all(get_clan, tags, concurrency, TIMEOUT)
+                line += "  {:>9.2f}s".format(time.perf_counter() - start)
+            print(line)
+
+        tags = {"clan {}".format(i): str(i) for i in range(16)}
+        tags["stuck"] = "slow"
+        start = time.perf_counter()
+        results = await fetch_all(get_clan, tags, CONCURRENCIES[-1], TIMEOUT)
+        failed = [name for name, result in results.items() if isinstance(result, Exception)]
+        print(
+            "16 clans and one that never answers: {:.2f}s, failed: {}".format(
+                time.perf_counter() - start, ", ".join(failed)
+            )
+        )
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+# Member fields compared between refreshes
+member_fields = ("name", "trophies", "donations", "donations_received", "exp_level")
+# Clan fields compared between refreshes
+clan_fields = (
+    "name",
+    "clan_war_trophies",
+    "clan_score",
+    "required_trophies",
+    "members",
+)
+
+role_hierarchy = {"member": 1, "elder": 2, "coleader": 3, "leader": 4}
+
+
+def role_rank(role) -> int:
+    return role_hierarchy.get((role or "").lower(), 0)
+
+
+class RoleChange(NamedTuple):
+    member: dict
+    old_role: str
+    new_role: str
+
+
+class ClanChanges(NamedTuple):
+    """Everything that changed in one clan between two refreshes.
+
+    ``member_deltas`` maps a member tag to ``{field: (old, new)}`` and
+    ``clan_deltas`` maps a clan field to ``(old, new)``.
+    """
+
+    key: str
+    name: str
+    tag: str
+    joined: List[dict]
+    left: List[dict]
+    promoted: List[RoleChange]
+    demoted: List[RoleChange]
+    member_deltas: Dict[str, Dict[str, Tuple]]
+    clan_deltas: Dict[str, Tuple]
+
+    def __bool__(self):
+        return bool(
+            self.joined
+            or self.left
+            or self.promoted
+            or self.demoted
+            or self.member_deltas
+            or self.clan_deltas
+        )
+
+
+def field_deltas(old: dict, new: dict, fields) -> Dict[str, Tuple]:
+    return {
+        field: (old.get(field), new.get(field))
+        for field in fields
+        if old.get(field) != new.get(field)
+    }
+
+
+def diff_clan(key: str, old: dict, new: dict) -> ClanChanges:
+    old_members = {member["tag"]: member for member in old.get("member_list", [])}
+    new_members = {member["tag"]: member for member in new.get("member_list", [])}
+
+    joined = [member for tag, member in new_members.items() if tag not in old_members]
+    left = [member for tag, member in old_members.items() if tag not in new_members]
+    promoted = []
+    demoted = []
+    member_deltas = {}
+    for tag, member in new_members.items():
+        old_member = old_members.get(tag)
+        if old_member is None:
+            continue
+        old_role = old_member.get("role", "")
+        new_role = member.get("role", "")
+        if role_rank(old_role) < role_rank(new_role):
+            promoted.append(RoleChange(member, old_role, new_role))
+        elif role_rank(old_role) > role_rank(new_role):
+            demoted.append(RoleChange(member, old_role, new_role))
+        deltas = field_deltas(old_member, member, member_fields)
+        if deltas:
+            member_deltas[tag] = deltas
+
+    return ClanChanges(
+        key=key,
+        name=new["name"],
+        tag=new["tag"],
+        joined=joined,
+        left=left,
+        promoted=promoted,
+        demoted=demoted,
+        member_deltas=member_deltas,
+        clan_deltas=field_deltas(old, new, clan_fields),
+    )
+
+
+def diff_clans(old_data: dict, new_data: dict) -> Dict[str, ClanChanges]:
+    """Changes of every clan present in both snapshots, keyed like the snapshots.
+
+    Clans without any change are left out.
+    """
+    changes = {}
+    for key, data in new_data.items():
+        if key not in old_data:
+            continue
+        clan_changes = diff_clan(key, old_data[key], data)
+        if clan_changes:
+            changes[key] = clan_changes
+    return changes
@@ -1,7 +1,6 @@
 import asyncio
 import json
 import logging
-from copy import deepcopy
 from datetime import datetime
 from time import sleep, time
 from typing import Dict, Literal, Optional
@@ -18,6 +17,9 @@ from redbot.core.utils import AsyncIter
 from redbot.core.utils.chat_formatting import humanize_list, pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 
+from .clandiff import diff_clans
+from .refresh import fetch_all
+
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
 
 log = logging.getLogger("red.cogs.clashroyaleclansv2")
@@ -50,6 +52,9 @@ class ClashRoyaleClans2(commands.Cog):
             "clans": dict(),
             "keep_memberlog": False,
             "dispatch_event": True,
+            # Above the family size so a refresh is about one round trip
+            "refresh_concurrency": 32,
+            "refresh_timeout": 10,
         }
         self.config = Config.get_conf(
             self,
@@ -72,6 +77,9 @@ class ClashRoyaleClans2(commands.Cog):
         self.clash = None
         self.last_updated = None
         self.last_updated_preety = None
+        # clan key -> when its data was last fetched, failed clans keep the
+        # time of their last successful fetch
+        self.clans_updated = {}
         self.last_error_time = None
         self.loop_count = 0
 
@@ -103,23 +111,46 @@ class ClashRoyaleClans2(commands.Cog):
         super().red_delete_data_for_user(requester=requester, user_id=user_id)
 
     async def refresh_data(self):
+        """Fetch every clan, returns (previous data, new data, fetched clan keys)"""
         try:
             with open(self.claninfo_path) as file:
                 self.static_clandata = dict(json.load(file))
+            concurrency = await self.config.refresh_concurrency()
+            timeout = await self.config.refresh_timeout()
+            clan_names = list(self.static_clandata.keys())
+            results = await fetch_all(
+                self.clash.get_clan,
+                {name: data["tag"] for name, data in self.static_clandata.items()},
+                concurrency,
+                timeout,
+            )
+            previous_data = await self.config.clans()
             all_clan_data = dict()
-            for name, data in self.static_clandata.items():
-                try:
-                    clan_tag = data["tag"]
-                    clan_data = (await self.clash.get_clan(clan_tag)).to_dict()
-                    all_clan_data[name] = clan_data
+            fetched = []
+            errors = []
+            for name, result in results.items():
+                if not isinstance(result, BaseException):
+                    all_clan_data[name] = result.to_dict()
+                    fetched.append(name)
+                    continue
+                errors.append(result)
                 # REMINDER: Order is important. RequestError is base exception class.
-                except clashroyale.NotFoundError:
-                    log.critical("Invalid clan tag.")
-                    raise
-                except clashroyale.RequestError:
+                if isinstance(result, clashroyale.NotFoundError):
+                    log.critical("Invalid clan tag for {}.".format(name))
+                elif isinstance(result, asyncio.TimeoutError):
+                    log.error("Timed out fetching data for {}.".format(name))
+                elif isinstance(result, clashroyale.RequestError):
                     log.error("Error: Cannot reach ClashRoyale Server.")
-                    raise
-            await self.config.clans.set(all_clan_data)
+                else:
+                    log.error(
+                        "Encountered exception {} when fetching {}.".format(result, name)
+                    )
+                # Keep the last known data so one failing clan does not drop out
+                if name in previous_data:
+                    all_clan_data[name] = previous_data[name]
+            if errors and len(errors) == len(clan_names):
+                raise errors[0]
+            return previous_data, all_clan_data, fetched
             # log.info("Updated data for all clans.")
         except Exception as e:
             log.error(
@@ -131,13 +162,10 @@ class ClashRoyaleClans2(commands.Cog):
         """Check current data against data stored in config."""
         if self is not self.bot.get_cog("ClashRoyaleClans2"):
             return
-        old_data = dict()
         dispatch_clandata_update = await self.config.dispatch_event()
-        if dispatch_clandata_update:
-            old_data = deepcopy(await self.config.clans())
 
         try:
-            await self.refresh_data()
+            old_data, new_data, fetched = await self.refresh_data()
         except Exception as e:
             if self.last_error_time:
                 if self.last_error_time - time.time() >= 300:
@@ -145,8 +173,6 @@ class ClashRoyaleClans2(commands.Cog):
                     self.last_error_time = time.time()
             return
 
-        new_data = deepcopy(await self.config.clans())
-        type(new_data)
         new_data = {
             k: v
             for k, v in sorted(
@@ -159,13 +185,19 @@ class ClashRoyaleClans2(commands.Cog):
         if len(new_data) == 0:
             log.error("Clans data is empty.")
             return
-        if dispatch_clandata_update:
-            self.bot.dispatch("clandata_update", old_data, new_data)
+        if dispatch_clandata_update and old_data:
+            changes = diff_clans(old_data, new_data)
+            if changes:
+                self.bot.dispatch("clandata_update", changes)
 
         await self.config.clans.set(new_data)
         self.last_error_time = None
         self.last_updated = datetime.now()
         self.last_updated_preety = datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
+        self.clans_updated = {
+            name: self.last_updated if name in fetched else self.clans_updated.get(name)
+            for name in new_data
+        }
         self.loop_count += 1
 
     def get_static_clankey(self, clankey):
@@ -392,7 +424,7 @@ class ClashRoyaleClans2(commands.Cog):
             absent_names = []  # Tags (URLS?) of people who aren't in Discord
             processed_tags = []
 
-            tags_by_member_id = self.tags.getTagsForUsers(
+            tags_by_member_id = await self.tags.getTagsForUsers(
                 [member.id for member in role.members]
             )
 
@@ -498,6 +530,29 @@ class ClashRoyaleClans2(commands.Cog):
         )
         await ctx.tick()
 
+    @clans.command(name="refreshsettings")
+    @checks.is_owner()
+    async def clans_refreshsettings(
+        self, ctx, concurrency: int = None, timeout: float = None
+    ):
+        """ Set how many clans are fetched at once and the per clan timeout in seconds """
+        if concurrency is not None:
+            if concurrency < 1:
+                await ctx.send("Concurrency must be at least 1.")
+                return
+            await self.config.refresh_concurrency.set(concurrency)
+        if timeout is not None:
+            if timeout <= 0:
+                await ctx.send("Timeout must be greater than 0.")
+                return
+            await self.config.refresh_timeout.set(timeout)
+        await ctx.send(
+            "Refreshing {} clans at once with a {}s timeout per clan.".format(
+                await self.config.refresh_concurrency(),
+                await self.config.refresh_timeout(),
+            )
+        )
+
     @clans.command(name="cwr")
     async def clans_cwr(self, ctx, clankey, league, percent: int):
         """ Set cwr as requirement for clan """
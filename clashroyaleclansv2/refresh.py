@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+
+async def fetch_all(
+    fetch: Callable[[str], Awaitable],
+    args: Dict[str, str],
+    concurrency: int,
+    timeout: float,
+) -> dict:
+    """Run fetch(arg) for every {key: arg} at once.
+
+    At most concurrency fetches run at the same time and each one is bounded
+    by timeout. Returns {key: result}, with the raised exception as the result
+    of a failed fetch.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(arg):
+        async with semaphore:
+            return await asyncio.wait_for(fetch(arg), timeout=timeout)
+
+    results = await asyncio.gather(
+        *(run(arg) for arg in args.values()), return_exceptions=True
+    )
+    return dict(zip(args, results))
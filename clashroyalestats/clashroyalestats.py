@@ -137,7 +137,7 @@ class ClashRoyale(commands.Cog):
             user = ctx.author
 
         try:
-            profiletag = self.tags.getTag(user.id, account)
+            profiletag = await self.tags.getTag(user.id, account)
             if profiletag is None:
                 return await ctx.send("You don't have a tag saved. "
                                       "Use !save <tag> to save a tag or that account number doesn't exist,"
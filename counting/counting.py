@@ -1,5 +1,9 @@
+import asyncio
+
 import discord
+from discord.ext import tasks
 from redbot.core import commands, bank, checks, Config
+from redbot.core.utils.chat_formatting import pagify
 
 bot_credits = 'Bot by: Legend Gaming | Generaleoley'
 base_help = """
@@ -29,6 +33,21 @@ __**Welcome to Counting!**__
 """
 
 
+class CountState:
+    """Counting state of a guild, written back to Config by the flush loop"""
+
+    fields = ('expected', 'user', 'players', 'record', 'payout')
+
+    def __init__(self, data: dict):
+        self.lock = asyncio.Lock()
+        self.dirty = False
+        for field in self.fields:
+            setattr(self, field, data[field])
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+
 class Counting(commands.Cog):
     """Counting Cog for Counting Game"""
 
@@ -54,6 +73,45 @@ class Counting(commands.Cog):
         }
         self.config.register_guild(**default_guild)
         # self.config.register_channel(**default_channel)
+        # counting channel id -> guild id
+        self.counting_channels = {}
+        # guild id -> CountState
+        self.states = {}
+        self.load_task = self.bot.loop.create_task(self.load_channels())
+        self.flush_states.start()
+
+    def cog_unload(self):
+        self.load_task.cancel()
+        self.flush_states.cancel()
+        self.bot.loop.create_task(self.flush())
+
+    async def load_channels(self):
+        for guild_id, data in (await self.config.all_guilds()).items():
+            if data.get('channel') is not None:
+                self.counting_channels[data['channel']] = guild_id
+
+    async def get_state(self, guild: discord.Guild) -> CountState:
+        state = self.states.get(guild.id)
+        if state is None:
+            state = CountState(await self.config.guild(guild).all())
+            state = self.states.setdefault(guild.id, state)
+        return state
+
+    async def flush(self):
+        """Write the changed counting states to Config"""
+        for guild_id, state in list(self.states.items()):
+            if not state.dirty:
+                continue
+            async with state.lock:
+                data = state.to_dict()
+                state.dirty = False
+            async with self.config.guild_from_id(guild_id).all() as guild_data:
+                guild_data.update(data)
+
+    @tasks.loop(seconds=30)
+    async def flush_states(self):
+        await self.flush()
+
     @commands.group()
     async def counting(self, ctx):
         """Base group for counting"""
@@ -66,13 +124,13 @@ class Counting(commands.Cog):
     @counting.command()
     async def record(self, ctx):
         """Get the highest count record"""
-        record = await self.config.guild(ctx.guild).record()
-        await ctx.send(record)
+        state = await self.get_state(ctx.guild)
+        await ctx.send(state.record)
 
     @counting.command(aliases=['payout'])
     async def payouts(self, ctx):
         """Get payout information"""
-        payouts = await self.config.guild(ctx.guild).payout()
+        payouts = (await self.get_state(ctx.guild)).payout
         embed = discord.Embed(title='Payouts',
                               description='Each number counted is the amount of credits given below when the count below is reached.',
                               color=0x008000)
@@ -98,7 +156,10 @@ class Counting(commands.Cog):
     @setcount.command()
     async def channel(self, ctx, channel: discord.TextChannel):
         """Set the channel in which the counting will take place"""
+        old_channel = await self.config.guild(ctx.guild).channel()
+        self.counting_channels.pop(old_channel, None)
         await self.config.guild(ctx.guild).channel.set(channel.id)
+        self.counting_channels[channel.id] = ctx.guild.id
         # todo confirmation
         await ctx.send("Done... channel set.")
 
@@ -106,96 +167,108 @@ class Counting(commands.Cog):
     @setcount.command()
     async def payoutst(self, ctx, count: int, payout: int):
         """Configuration of Payouts"""
-        vals = await self.config.guild(ctx.guild).payout()
-
-        if payout == 0:
-            del vals[str(count)]
-        else:
-            vals[str(count)] = payout
-
-        await self.config.guild(ctx.guild).payout.set(vals)
+        state = await self.get_state(ctx.guild)
+        async with state.lock:
+            if payout == 0:
+                del state.payout[str(count)]
+            else:
+                state.payout[str(count)] = payout
+            state.dirty = True
         await ctx.send("Done...")
 
     @checks.admin_or_permissions()
     @setcount.command()
     async def expected(self, ctx, count: int):
         """Manually set the count, note that this will mess up the payouts and nothing will be paid for the skipped numbers"""
-        await self.config.guild(ctx.guild).expected.set(str(count))
+        state = await self.get_state(ctx.guild)
+        async with state.lock:
+            state.expected = str(count)
+            state.dirty = True
         await ctx.send("Done... ")
 
     # Listeners
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author.bot:
+        # Cheap check first, most messages are not in a counting channel
+        if message.channel.id not in self.counting_channels:
             return
-        data = self.config.guild(message.guild)
-        channel_check = await data.channel()
-        # payouts = await self.config.guild(message.guild).payout()
-        # milestones = []
-        # for payout in payouts:
-        #     milestones.append(payout)
-        if message.channel.id != channel_check:
+        if message.author.bot or message.guild is None:
             return
 
-        expected = await data.expected()
-        user = await data.user()
-
         num = str(message.content)
 
         if num[:2] == '\%':
             return
 
         author = str(message.author.id)
+        state = await self.get_state(message.guild)
 
-        if num == expected and user != author:
-            new = int(expected) + 1
-            await data.expected.set(str(new))
-            players = await data.players()
-            # print(players)
-            winpay = await data.payout()
-            record = await data.record()
-            await message.add_reaction(emoji='✅')
-            await data.user.set(author)
-            if players.get(author) is None:
-                players[author] = 1
-                # print("here")
-                # print(players[message.author.id])
+        async with state.lock:
+            expected = state.expected
+            correct = num == expected and state.user != author
+            if correct:
+                new = int(expected) + 1
+                state.expected = str(new)
+                state.user = author
+                state.players[author] = state.players.get(author, 0) + 1
+                new_record = int(expected) > state.record
+                if new_record:
+                    state.record = int(expected)
+                winpay = state.payout.get(expected)
+                players = dict(state.players)
             else:
-                players[author] += 1
-                # print(players[message.author.id])
-
-            # print(players)
-            await data.players.set(players)
-
-            # print(record)
-            # print(winpay[expected])
-
-            # check record
-            if int(expected) > record:
-                await data.record.set(int(expected))
-                await message.add_reaction(emoji='🎉')
-
-            # check win
-            if winpay.get(expected) is not None:
-                await message.channel.send(
-                    "Congrats! On reaching {}... the following rewards are to follow: (ps. don't celebrate here as it will reset scores)".format(
-                        expected))
-                # print(players)
-                for player in players:
-                    if player == 0 or player == '0':
-                        continue
-                    memb = message.guild.get_member(int(player))
-                    amount = winpay[expected] * players[player]
-                    await bank.deposit_credits(memb, amount)
-                    await message.channel.send("- {} has received {}".format(memb.mention, str(amount)))
-
-                await message.channel.send(
-                    "You may continue counting without loss at {} (say that number)".format(str(new)))
-
-
-        else:
+                state.user = None
+                state.expected = '1'
+                state.players = {}
+            state.dirty = True
+
+        if not correct:
             await message.add_reaction(emoji='❌')
             await message.channel.send("Reset back to 1.")
-            await data.user.set(None)
-            await data.expected.set('1')
-            await data.players.set({})
+            return
+
+        await message.add_reaction(emoji='✅')
+        # check record
+        if new_record:
+            await message.add_reaction(emoji='🎉')
+
+        # check win, paid out in the background so counting can go on
+        if winpay is not None:
+            self.bot.loop.create_task(self.payout(message.channel, expected, new, winpay, players))
+
+    async def payout(self, channel: discord.TextChannel, expected: str, new: int, winpay: int, players: dict):
+        """Pay every player of the run for reaching a milestone and post one summary"""
+        payments = []
+        for player, count in players.items():
+            if player == 0 or player == '0':
+                continue
+            memb = channel.guild.get_member(int(player))
+            if memb is not None:
+                payments.append((memb, winpay * count))
+
+        # Every member has its own bank account, so deposits can run together
+        results = await asyncio.gather(
+            *(bank.deposit_credits(memb, amount) for memb, amount in payments),
+            return_exceptions=True,
+        )
+        lines = []
+        for (memb, amount), result in zip(payments, results):
+            if isinstance(result, Exception):
+                lines.append("- {} could not receive {} ({})".format(memb.mention, amount, result))
+            else:
+                lines.append("- {} has received {}".format(memb.mention, amount))
+
+        pages = list(pagify("\n".join(lines), page_length=2000)) or ["Nobody to pay."]
+        for i, page in enumerate(pages):
+            embed = discord.Embed(
+                title="Congrats! On reaching {}... the following rewards were paid:".format(expected),
+                description=page,
+                color=0x008000,
+            )
+            if i == len(pages) - 1:
+                embed.add_field(
+                    name="Keep going",
+                    value="You may continue counting without loss at {} (say that number). Don't celebrate here as it will reset scores.".format(new),
+                )
+            embed.set_footer(text=bot_credits)
+            await channel.send(embed=embed)
@@ -43,7 +43,7 @@ class LegendEsports(commands.Cog):
             command_used = await self.config.member(user).command_used()
             if command_used is False or await self.bot.is_mod(ctx.author):
                 if await self.bot.is_mod(ctx.author) or for_self:
-                    player_tag = self.tags.getTag(userID = user.id)
+                    player_tag = await self.tags.getTag(userID = user.id)
                     if player_tag is None:
                         return await ctx.send("No tag saved, use the command `!save <your tage here>`")
 
@@ -156,7 +156,7 @@ class LegendEsports(commands.Cog):
     async def verify(self, ctx):
         """Verify yourself and get access to the server if here for a tryout use `!tryouts` instead"""
         if ctx.guild.id == 445092370006933505:
-            player_tag = self.tags.getTag(userID=ctx.author.id)
+            player_tag = await self.tags.getTag(userID=ctx.author.id)
             if player_tag is None:
                 return await ctx.send("Player tag not saved, use `!save <#your player tag here>`")
             try:
@@ -0,0 +1,65 @@
+"""Benchmark of the bulk Tags lookups against one query per row.
+
+Looks up the users of a 50 member clan's tags and the tags of a 1,000
+member role, once per row like the commands used to and once with a single
+IN query. Uses the fake database of bench_tags.py:
+
+    python crtoolsdb/bench_bulk.py
+"""
+import asyncio
+import random
+import time
+
+from bench_tags import FakeTags, make_rows
+
+CLAN = 50
+ROLE = 1000
+
+
+async def timed(rows, lookup):
+    tags = FakeTags(rows)
+    start = time.perf_counter()
+    result = await lookup(tags)
+    elapsed = time.perf_counter() - start
+    tags.close()
+    return result, tags.db.queries, elapsed
+
+
+async def per_tag(tags, clan):
+    return {tag: await tags.getUser(tag) for tag in clan}
+
+
+async def per_user(tags, role):
+    return {user: await tags.quickGetAllTags(user) for user in role}
+
+
+async def main():
+    rng = random.Random(0)
+    rows = make_rows(ROLE, rng)
+    clan = [tag for _, tag, _ in rng.sample(rows, CLAN)]
+    role = list(range(ROLE))
+
+    for name, single, bulk in (
+        (
+            "{} member clan".format(CLAN),
+            lambda tags: per_tag(tags, clan),
+            lambda tags: tags.getUsersForTags(clan),
+        ),
+        (
+            "{} member role".format(ROLE),
+            lambda tags: per_user(tags, role),
+            lambda tags: tags.getAllTagsForUsers(role),
+        ),
+    ):
+        old, old_queries, old_time = await timed(rows, single)
+        new, new_queries, new_time = await timed(rows, bulk)
+        assert old == new, name
+        print(
+            "{}: {} queries in {:.3f}s per row, {} in {:.3f}s in bulk".format(
+                name, old_queries, old_time, new_queries, new_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+"""Load test of Tags against a slow fake database.
+
+Fires a few hundred getTag and getUser lookups at once and measures how
+late a coroutine ticking every few milliseconds gets to run, once with the
+queries run on the event loop like before and once through the worker
+threads. Needs mysql-connector-python but neither Red nor a database:
+
+    python crtoolsdb/bench_tags.py
+"""
+import asyncio
+import random
+import time
+
+from tags import Tags
+
+USERS = 300
+# Seconds every query takes, a round trip to a busy database
+LATENCY = 0.005
+TICK = 0.005
+tag_chars = "PYLQGRJCUV0289"
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def execute(self, query, args=()):
+        time.sleep(LATENCY)
+        self.db.queries += 1
+        rows = self.db.rows
+        if query.startswith("SELECT tag FROM tags WHERE user_id = %s"):
+            found = [(tag, account) for user, tag, account in rows if user == args[0]]
+            self.result = [(tag,) for tag, _ in sorted(found, key=lambda x: x[1])]
+        elif query.startswith("SELECT user_id, account FROM tags WHERE tag = %s"):
+            self.result = [(user, account) for user, tag, account in rows if tag == args[0]]
+        elif query.startswith("SELECT user_id, tag FROM tags WHERE user_id IN"):
+            wanted = set(args)
+            found = sorted((user, account, tag) for user, tag, account in rows if user in wanted)
+            self.result = [(user, tag) for user, _, tag in found]
+        elif query.startswith("SELECT tag, user_id, account FROM tags WHERE tag IN"):
+            wanted = set(args)
+            self.result = [(tag, user, account) for user, tag, account in rows if tag in wanted]
+        else:
+            raise ValueError(query)
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, prepared=False):
+        return FakeCursor(self.db)
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    """In memory tags table, handed out like a connection pool"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def get_connection(self):
+        return FakeConnection(self)
+
+
+class FakeTags(Tags):
+    def __init__(self, rows, **kwargs):
+        self.db = FakeDB(rows)
+        super().__init__(None, None, None, None, **kwargs)
+
+    def setupConnection(self):
+        self.pool = self.db
+
+
+class BlockingTags(FakeTags):
+    """Runs every query on the event loop, like Tags did before"""
+
+    async def _run(self, func, *args):
+        return self._withCursor(func, *args)
+
+
+def make_rows(users, rng):
+    rows = []
+    for user in range(users):
+        for account in range(1, rng.randint(1, 3) + 1):
+            tag = "".join(rng.choice(tag_chars) for _ in range(8))
+            rows.append((user, tag, account))
+    return rows
+
+
+async def lookups(tags, rows):
+    """Every user's main tag and the users of every tag, all at once"""
+    await asyncio.gather(
+        *(tags.getTag(user) for user in range(USERS)),
+        *(tags.getUser(tag) for _, tag, _ in rows[:USERS]),
+    )
+
+
+async def measure(tags, rows):
+    lag = 0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            expected = time.perf_counter() + TICK
+            await asyncio.sleep(TICK)
+            lag = max(lag, time.perf_counter() - expected)
+
+    tick_task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await lookups(tags, rows)
+    elapsed = time.perf_counter() - start
+    done = True
+    await tick_task
+    return elapsed, lag
+
+
+async def main():
+    rows = make_rows(USERS, random.Random(0))
+    for name, cls in (("on the loop", BlockingTags), ("worker threads", FakeTags)):
+        tags = cls(rows)
+        elapsed, lag = await measure(tags, rows)
+        print(
+            "{}: {} queries in {:.2f}s, longest event loop stall {:.0f}ms".format(
+                name, tags.db.queries, elapsed, lag * 1000
+            )
+        )
+        tags.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,36 +3,16 @@ from json import load
 import aiohttp
 import clashroyale
 import discord
-import mysql.connector
 from redbot.core import Config, checks, commands
 from redbot.core.data_manager import bundled_data_path
 
-
-class InvalidTag(Exception):
-    pass
-
-
-class TagAlreadySaved(Exception):
-    """Note on this:
-
-    This is only called when two tags from the same ID is saved
-
-    Two people can have the same main / alts (Account sharing is a big thing nowadays)
-    """
-
-    pass
-
-
-class MainAlreadySaved(Exception):
-    pass
-
-
-class InvalidArgument(Exception):
-    pass
-
-
-class NoConnection(Exception):
-    pass
+from .tags import (
+    InvalidArgument,
+    InvalidTag,
+    MainAlreadySaved,
+    TagAlreadySaved,
+    Tags,
+)
 
 
 class Constants:
@@ -110,244 +90,6 @@ class Constants:
                 return self.images + "badges/" + i["name"] + ".png"
 
 
-class Tags:
-    """Tag Management with Database
-
-    Upgraded Version of Gr8's crtools by Generaleoley
-    """
-
-    def __init__(self, host, user, password, database):
-        # hard coding because it's only us using this rn, future can use shared api key
-        self.host = host
-        self.user = user
-        self.password = password
-        self.database = database
-        self.setupConnection()
-
-    def setupConnection(self):
-        self.db = mysql.connector.connect(
-            host=self.host,
-            user=self.user,
-            password=self.password,
-            database=self.database,
-            connection_timeout=5,
-        )
-        if not self.db:
-            raise NoConnection
-        self.db.autocommit = True
-
-    def setupDB(self):
-        cursor = self.getCursor()
-
-        query = f"""CREATE TABLE IF NOT EXISTS `tags` (
-            `id` int(11) NOT NULL AUTO_INCREMENT,
-            `user_id` bigint(20) NOT NULL,
-            `tag` varchar(15) NOT NULL,
-            `account` int(32) NOT NULL,
-            PRIMARY KEY (`id`),
-            KEY `idx_user_id` (`user_id`),
-            KEY `idx_tag` (`tag`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """
-        cursor.execute(query)
-        return
-
-    def getCursor(self):
-        try:
-            self.db.ping(reconnect=True, attempts=3, delay=1)
-        except mysql.connector.Error as err:
-            self.db.close()
-            self.setupConnection()
-        return self.db.cursor()
-
-    @staticmethod
-    def verifyTag(tag):
-        """Check if a player's tag is valid
-
-        Credit: Gr8
-        """
-        check = ["P", "Y", "L", "Q", "G", "R", "J", "C", "U", "V", "0", "2", "8", "9"]
-        if len(tag) > 15:
-            return False
-        if any(i not in check for i in tag):
-            return False
-
-        return True
-
-    @staticmethod
-    def formatTag(tag):
-        """Sanitize and format CR Tag
-
-        Credit: Gr8
-        """
-        return tag.strip("#").upper().replace("O", "0")
-
-    def getTag(self, userID, account=1):
-        """Get's a user's tag. Account 1 = Main
-
-        If the account does not exist / not saved it returns None
-        """
-        cursor = self.getCursor()
-
-        if self.accountCount(userID) < account or account < 1:
-            return None
-
-        query = f"SELECT tag FROM tags WHERE user_id = {userID} AND account = {account}"
-        cursor.execute(query)
-        return cursor.fetchone()[0]
-
-    def accountCount(self, userID):
-        """Get's the amount of accounts a user has
-
-        Return value: Int
-
-        0 - No accounts saved
-        1 - Main Account Saved
-        2+ - Main Account Saved + Some amount of alts (-1 to get the amount)
-        """
-        cursor = self.getCursor()
-        query = f"SELECT id from tags WHERE user_id = {userID}"
-        cursor.execute(query)
-        return len(cursor.fetchall())
-
-    def getTagsForUsers(self, userIDs):
-        tagsByUser = {}
-
-        userString = ",".join([str(userID) for userID in userIDs])
-        query = f"SELECT user_id, tag FROM tags WHERE user_id IN ({userString})"
-
-        cursor = self.getCursor()
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            tagsByUser.setdefault(row[0], [])
-            tagsByUser[row[0]].append(row[1])
-        return tagsByUser
-
-    def quickGetAllTags(self, userID):
-        tags = []
-
-        query = f"SELECT tag FROM tags WHERE user_id = {userID}"
-        cursor = self.getCursor()
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            tags.append(row[0])
-        return tags
-
-    def getAllTags(self, userID):
-        """Returns a list of all tags from the given userID"""
-        tags = []
-        for count in range(self.accountCount(userID)):
-            tag = self.getTag(userID, count + 1)
-            tags.append(tag)
-        return tags
-
-    def saveTag(self, userID, tag):
-        """Saves a tag to a player.
-
-        Alt's are auto indexed
-        """
-        cursor = self.getCursor()
-
-        count = self.accountCount(userID)
-
-        tag = self.formatTag(tag=tag)
-        if not self.verifyTag(tag):
-            raise InvalidTag
-        # if not main and count == 0:
-        #     raise NoMainSaved
-        # if main and count != 0:
-        #     raise MainAlreadySaved
-        if tag in self.getAllTags(userID):
-            raise TagAlreadySaved
-
-        account = count + 1
-
-        query = f"INSERT INTO tags (user_id, tag, account) VALUES ({userID}, '{tag}', {account})"
-        cursor.execute(query)
-
-        return account
-
-    def unlinkTag(self, userID, tag=None, account=None):
-        """You can choose to use tag or account but not both or none"""
-        cursor = self.getCursor()
-
-        if (tag is None and account is None) or (
-            tag is not None and account is not None
-        ):
-            raise TypeError
-
-        if tag is not None:
-            tag = self.formatTag(tag=tag)
-            if not self.verifyTag(tag):
-                raise InvalidTag
-
-            tags = self.getAllTags(userID)
-
-            if tag not in tags:
-                raise InvalidArgument
-            for item in range(len(tags)):
-                if tags[item] == tag:
-                    account = item + 1
-
-        if account > self.accountCount(userID):
-            raise InvalidArgument
-
-        count = self.accountCount(userID)
-
-        # Removes the tag and shifts the others if needed
-        query = f"DELETE FROM tags WHERE user_id = {userID} AND account = {account}"
-        cursor.execute(query)
-
-        for item in range(account, count):
-            query = f"UPDATE tags SET account = {item} WHERE user_id = {userID} AND account = {item + 1}"
-            cursor.execute(query)
-
-    def switchPlace(self, userID, account1, account2):
-        """Switch the place of account 1 with 2"""
-
-        cursor = self.getCursor()
-
-        count = self.accountCount(userID)
-
-        if (account1 > count or account1 < 1) or (account2 > count or account2 < 1):
-            raise InvalidArgument
-
-        querya = f"UPDATE tags SET account = 0 WHERE user_id = {userID} and account = {account1}"
-        queryb = f"UPDATE tags SET account = {account1} WHERE user_id = {userID} and account = {account2}"
-        queryc = f"UPDATE tags SET account = {account2} WHERE user_id = {userID} and account = 0"
-        cursor.execute(querya)
-        cursor.execute(queryb)
-        cursor.execute(queryc)
-
-    def getUser(self, tag):
-        """Get all users that have this tag, returns dict in list
-
-        [
-            (userID, account)
-        ]
-        """
-
-        cursor = self.getCursor()
-
-        tag = self.formatTag(tag=tag)
-        if not self.verifyTag(tag):
-            raise InvalidTag
-
-        query = f"SELECT user_id, account FROM tags WHERE tag = '{tag}'"
-        cursor.execute(query)
-
-        return cursor.fetchall()
-
-    def moveUserID(self, oldUserID, newUserID):
-        """To be used when a person changes accounts"""
-        if self.accountCount(newUserID) != 0:
-            raise MainAlreadySaved
-
-        cursor = self.getCursor()
-        query = f"UPDATE tags SET user_id = {newUserID} WHERE user_id = {oldUserID}"
-        cursor.execute(query)
-
-
 class ClashRoyaleTools(commands.Cog):
     """Assortment of commands for clash royale"""
 
@@ -355,7 +97,12 @@ class ClashRoyaleTools(commands.Cog):
         self.bot = bot
         self.constants = Constants()
         self.config = Config.get_conf(self, identifier=69420)
-        default_global = {"emote_servers": False, "server_with_space": None}
+        default_global = {
+            "emote_servers": False,
+            "server_with_space": None,
+            "tag_cache_size": 10000,
+            "tag_cache_ttl": 3600,
+        }
         self.config.register_global(**default_global)
 
         self.token_task = self.bot.loop.create_task(self.crtoken())
@@ -369,8 +116,10 @@ class ClashRoyaleTools(commands.Cog):
                 database["user"],
                 database["password"],
                 database["database"],
+                cache_size=await self.config.tag_cache_size(),
+                cache_ttl=await self.config.tag_cache_ttl(),
             )
-            self.tags.setupDB()
+            await self.tags.setupDB()
         except Exception as e:
             print(
                 "Database Credentials are not set or something went wrong Exception below. "
@@ -400,7 +149,7 @@ class ClashRoyaleTools(commands.Cog):
         if getattr(self, "cr", None):
             self.bot.loop.create_task(self.cr.close())
         if getattr(self, "tags", None):
-            self.tags.db.close()
+            self.tags.close()
 
     @commands.group(name="crtools")
     async def _crtools(self, ctx):
@@ -433,7 +182,7 @@ class ClashRoyaleTools(commands.Cog):
             return await ctx.send("Sorry the CR API is down.")
 
         try:
-            self.tags.saveTag(userID=user.id, tag=tag)
+            await self.tags.saveTag(userID=user.id, tag=tag)
             embed = discord.Embed(
                 color=discord.Color.green(),
                 description="Use !accounts to see all accounts",
@@ -466,7 +215,7 @@ class ClashRoyaleTools(commands.Cog):
         if user is None:
             user = ctx.author
 
-        tags = self.tags.getAllTags(user.id)
+        tags = await self.tags.getAllTags(user.id)
 
         embed = discord.Embed(
             title=f"{user.display_name} Clash Royale Accounts: ",
@@ -508,7 +257,7 @@ class ClashRoyaleTools(commands.Cog):
             user = ctx.author
 
         try:
-            self.tags.switchPlace(user.id, accounta, accountb)
+            await self.tags.switchPlace(user.id, accounta, accountb)
             await ctx.send("Done! Your accounts have been swapped!")
             await self.listaccounts(ctx, user=user)
         except InvalidArgument:
@@ -532,7 +281,7 @@ class ClashRoyaleTools(commands.Cog):
             user = ctx.author
 
         try:
-            self.tags.unlinkTag(userID=user.id, account=account)
+            await self.tags.unlinkTag(userID=user.id, account=account)
             await ctx.send("Account Unlinked!")
             await self.listaccounts(ctx, user=user)
         except InvalidArgument:
@@ -541,6 +290,25 @@ class ClashRoyaleTools(commands.Cog):
                 " Do `[p]crtools accounts` to see the accounts you have saved"
             )
 
+    @checks.is_owner()
+    @_crtools.command(name="tagcache")
+    async def tag_cache_settings(self, ctx, size: int = None, ttl: int = None):
+        """Set the size and time to live (seconds) of the tag cache. 0 means unbounded"""
+        if size is not None:
+            await self.config.tag_cache_size.set(size or None)
+            self.tags.tagsByUser.maxsize = size or None
+            self.tags.usersByTag.maxsize = size or None
+        if ttl is not None:
+            await self.config.tag_cache_ttl.set(ttl or None)
+            self.tags.tagsByUser.ttl = ttl or None
+            self.tags.usersByTag.ttl = ttl or None
+        self.tags.clearCache()
+        await ctx.send(
+            "Tag cache: size {}, ttl {}".format(
+                self.tags.tagsByUser.maxsize, self.tags.tagsByUser.ttl
+            )
+        )
+
     @checks.mod_or_permissions(manage_roles=True)
     @_crtools.command(name="account_transfer")
     async def admin_account_transfer(
@@ -548,7 +316,7 @@ class ClashRoyaleTools(commands.Cog):
     ):
         """Administratively Transfer all Tags from one account to another"""
         try:
-            self.tags.moveUserID(oldAccount.id, newAccount.id)
+            await self.tags.moveUserID(oldAccount.id, newAccount.id)
         except MainAlreadySaved:
             return await ctx.send(
                 f"{newAccount.mention} already has accounts."
@@ -561,7 +329,7 @@ class ClashRoyaleTools(commands.Cog):
     async def get_linked_users(self, ctx, tag):
         """Fetches a list of people that have this account saved"""
         try:
-            users = self.tags.getUser(tag)
+            users = await self.tags.getUser(tag)
             if users is None:
                 return await ctx.send(
                     "This account isn't linked to any discord account"
@@ -0,0 +1,552 @@
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+import mysql.connector
+from mysql.connector import pooling
+
+
+class InvalidTag(Exception):
+    pass
+
+
+class TagAlreadySaved(Exception):
+    """Note on this:
+
+    This is only called when two tags from the same ID is saved
+
+    Two people can have the same main / alts (Account sharing is a big thing nowadays)
+    """
+
+    pass
+
+
+class MainAlreadySaved(Exception):
+    pass
+
+
+class InvalidArgument(Exception):
+    pass
+
+
+class NoConnection(Exception):
+    pass
+
+
+class TagCache:
+    """Small LRU cache with an optional time to live
+
+    maxsize=None keeps every entry, ttl=None never expires them.
+    """
+
+    _missing = object()
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, self._missing)
+        if entry is self._missing:
+            return default
+        value, stored = entry
+        if self.ttl is not None and monotonic() - stored > self.ttl:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, self._missing) is not self._missing
+
+    def set(self, key, value):
+        self._data[key] = (value, monotonic())
+        self._data.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class Tags:
+    """Tag Management with Database
+
+    Upgraded Version of Gr8's crtools by Generaleoley
+
+    Queries run on a small thread pool backed by a MySQL connection pool so
+    that a slow query never blocks the event loop. Every public query method
+    is a coroutine.
+
+    The user -> tags and tag -> users mappings are cached in memory and kept
+    in sync by every method that writes to the table.
+    """
+
+    def __init__(
+        self,
+        host,
+        user,
+        password,
+        database,
+        pool_size=5,
+        cache_size=None,
+        cache_ttl=None,
+    ):
+        # hard coding because it's only us using this rn, future can use shared api key
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.pool_size = pool_size
+        # One worker per pooled connection so a worker never waits on the pool
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="crtoolsdb"
+        )
+        # userID -> [tag of account 1, tag of account 2, ...]
+        self.tagsByUser = TagCache(cache_size, cache_ttl)
+        # tag -> [(userID, account), ...]
+        self.usersByTag = TagCache(cache_size, cache_ttl)
+        # Reads only cache their result when no write touched the same user
+        # or tag while the query ran, see _bump and _unchanged
+        self._generation = 0
+        self._written = {}
+        # generation a read started at -> number of those reads still running
+        self._reads = {}
+        self._poolLock = threading.Lock()
+        self.setupConnection()
+
+    def setupConnection(self):
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name="crtoolsdb",
+            pool_size=self.pool_size,
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            connection_timeout=5,
+            autocommit=True,
+        )
+        if not self.pool:
+            raise NoConnection
+
+    def close(self):
+        """Stop the worker threads and drop the pool
+
+        Cogs keep a reference to this instance across a crtoolsdb reload, so
+        the next query sets both up again instead of failing.
+        """
+        executor, self.executor = self.executor, None
+        self.pool = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _withCursor(self, func, *args):
+        """Run func(cursor, *args) on a pooled connection (worker thread)"""
+        with self._poolLock:
+            if self.pool is None:
+                self.setupConnection()
+            pool = self.pool
+        try:
+            connection = pool.get_connection()
+        except mysql.connector.Error:
+            # Pool could not hand out a live connection, rebuild it once
+            with self._poolLock:
+                if self.pool is pool:
+                    self.setupConnection()
+                pool = self.pool
+            connection = pool.get_connection()
+        try:
+            cursor = connection.cursor(prepared=True)
+            try:
+                return func(cursor, *args)
+            finally:
+                cursor.close()
+        finally:
+            # Returns the connection to the pool
+            connection.close()
+
+    async def _run(self, func, *args):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.pool_size, thread_name_prefix="crtoolsdb"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._withCursor, func, *args)
+        )
+
+    async def setupDB(self):
+        query = f"""CREATE TABLE IF NOT EXISTS `tags` (
+            `id` int(11) NOT NULL AUTO_INCREMENT,
+            `user_id` bigint(20) NOT NULL,
+            `tag` varchar(15) NOT NULL,
+            `account` int(32) NOT NULL,
+            PRIMARY KEY (`id`),
+            KEY `idx_user_id` (`user_id`),
+            KEY `idx_tag` (`tag`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+
+        def execute(cursor):
+            cursor.execute(query)
+
+        await self._run(execute)
+
+    @staticmethod
+    def verifyTag(tag):
+        """Check if a player's tag is valid
+
+        Credit: Gr8
+        """
+        check = ["P", "Y", "L", "Q", "G", "R", "J", "C", "U", "V", "0", "2", "8", "9"]
+        if len(tag) > 15:
+            return False
+        if any(i not in check for i in tag):
+            return False
+
+        return True
+
+    @staticmethod
+    def formatTag(tag):
+        """Sanitize and format CR Tag
+
+        Credit: Gr8
+        """
+        return tag.strip("#").upper().replace("O", "0")
+
+    # Blocking helpers, only ever called from a worker thread through _run
+
+    @staticmethod
+    def _getAllTags(cursor, userID):
+        query = "SELECT tag FROM tags WHERE user_id = %s ORDER BY account"
+        cursor.execute(query, (userID,))
+        return [row[0] for row in cursor.fetchall()]
+
+    # Cache bookkeeping, only ever called from the event loop
+
+    def _cacheUser(self, userID, tags, previous=()):
+        """Store a user's complete tag list and update cached reverse entries
+
+        previous are the tags the user had before a write, in case they are
+        no longer in the forward cache.
+        """
+        oldTags = self.tagsByUser.get(userID, [])
+        for tag in set(oldTags) | set(previous) | set(tags):
+            users = self.usersByTag.get(tag)
+            if users is None:
+                continue
+            users = [user for user in users if user[0] != userID]
+            users.extend(
+                (userID, account + 1)
+                for account, saved in enumerate(tags)
+                if saved == tag
+            )
+            self.usersByTag.set(tag, users)
+        self.tagsByUser.set(userID, list(tags))
+
+    def _bump(self, userIDs=(), tags=()):
+        """Record a finished write to the given users and tags"""
+        self._generation += 1
+        if not self._reads:
+            # No read is running that the write could make stale
+            return
+        for userID in userIDs:
+            self._written[("user", userID)] = self._generation
+        for tag in tags:
+            self._written[("tag", tag)] = self._generation
+
+    def _unchanged(self, start, userIDs=(), tags=()):
+        """Whether no write to the users and tags finished since generation start"""
+        return all(
+            self._written.get(("user", userID), 0) <= start for userID in userIDs
+        ) and all(self._written.get(("tag", tag), 0) <= start for tag in tags)
+
+    def _startRead(self):
+        """Generation to pass to _unchanged and then to _finishRead"""
+        start = self._generation
+        self._reads[start] = self._reads.get(start, 0) + 1
+        return start
+
+    def _finishRead(self, start):
+        self._reads[start] -= 1
+        if not self._reads[start]:
+            del self._reads[start]
+        # Writes no running read started before are not needed anymore
+        oldest = min(self._reads, default=self._generation)
+        if any(generation <= oldest for generation in self._written.values()):
+            self._written = {
+                key: generation
+                for key, generation in self._written.items()
+                if generation > oldest
+            }
+
+    def clearCache(self):
+        self.tagsByUser.clear()
+        self.usersByTag.clear()
+
+    async def getTag(self, userID, account=1):
+        """Get's a user's tag. Account 1 = Main
+
+        If the account does not exist / not saved it returns None
+        """
+        tags = await self.getAllTags(userID)
+        if len(tags) < account or account < 1:
+            return None
+        return tags[account - 1]
+
+    async def accountCount(self, userID):
+        """Get's the amount of accounts a user has
+
+        Return value: Int
+
+        0 - No accounts saved
+        1 - Main Account Saved
+        2+ - Main Account Saved + Some amount of alts (-1 to get the amount)
+        """
+        return len(await self.getAllTags(userID))
+
+    async def getTagsForUsers(self, userIDs):
+        """Like getAllTagsForUsers but leaves out users without saved tags"""
+        tagsByUser = await self.getAllTagsForUsers(userIDs)
+        return {userID: tags for userID, tags in tagsByUser.items() if tags}
+
+    async def getAllTagsForUsers(self, userIDs):
+        """Returns {userID: [tags]} for every given userID in a single query
+
+        Tags are ordered by account, users without saved tags map to []
+        """
+        tagsByUser = {}
+        missing = []
+        for userID in userIDs:
+            tags = self.tagsByUser.get(userID)
+            if tags is None:
+                missing.append(userID)
+            else:
+                tagsByUser[userID] = list(tags)
+        if not missing:
+            return tagsByUser
+
+        def execute(cursor):
+            rows = {}
+            placeholders = ",".join(["%s"] * len(missing))
+            query = (
+                f"SELECT user_id, tag FROM tags WHERE user_id IN ({placeholders})"
+                " ORDER BY user_id, account"
+            )
+            cursor.execute(query, tuple(missing))
+            for row in cursor.fetchall():
+                rows.setdefault(row[0], [])
+                rows[row[0]].append(row[1])
+            return rows
+
+        start = self._startRead()
+        try:
+            rows = await self._run(execute)
+            for userID in missing:
+                tags = rows.get(userID, [])
+                if self._unchanged(start, userIDs=(userID,)):
+                    self._cacheUser(userID, tags)
+                tagsByUser[userID] = list(tags)
+        finally:
+            self._finishRead(start)
+        return tagsByUser
+
+    async def quickGetAllTags(self, userID):
+        return await self.getAllTags(userID)
+
+    async def getAllTags(self, userID):
+        """Returns a list of all tags from the given userID"""
+        tags = self.tagsByUser.get(userID)
+        if tags is None:
+            start = self._startRead()
+            try:
+                tags = await self._run(self._getAllTags, userID)
+                if self._unchanged(start, userIDs=(userID,)):
+                    self._cacheUser(userID, tags)
+            finally:
+                self._finishRead(start)
+        return list(tags)
+
+    async def saveTag(self, userID, tag):
+        """Saves a tag to a player.
+
+        Alt's are auto indexed
+        """
+        tag = self.formatTag(tag=tag)
+        if not self.verifyTag(tag):
+            raise InvalidTag
+
+        def execute(cursor):
+            tags = self._getAllTags(cursor, userID)
+            # if not main and count == 0:
+            #     raise NoMainSaved
+            # if main and count != 0:
+            #     raise MainAlreadySaved
+            if tag in tags:
+                raise TagAlreadySaved
+
+            account = len(tags) + 1
+
+            query = "INSERT INTO tags (user_id, tag, account) VALUES (%s, %s, %s)"
+            cursor.execute(query, (userID, tag, account))
+            return tags + [tag]
+
+        tags = await self._run(execute)
+        self._bump((userID,), tags)
+        self._cacheUser(userID, tags)
+        return len(tags)
+
+    async def unlinkTag(self, userID, tag=None, account=None):
+        """You can choose to use tag or account but not both or none"""
+        if (tag is None and account is None) or (
+            tag is not None and account is not None
+        ):
+            raise TypeError
+
+        if tag is not None:
+            tag = self.formatTag(tag=tag)
+            if not self.verifyTag(tag):
+                raise InvalidTag
+
+        def execute(cursor, account):
+            tags = self._getAllTags(cursor, userID)
+
+            if tag is not None:
+                if tag not in tags:
+                    raise InvalidArgument
+                for item in range(len(tags)):
+                    if tags[item] == tag:
+                        account = item + 1
+
+            count = len(tags)
+
+            if account > count:
+                raise InvalidArgument
+
+            # Removes the tag and shifts the others if needed
+            query = "DELETE FROM tags WHERE user_id = %s AND account = %s"
+            cursor.execute(query, (userID, account))
+
+            query = "UPDATE tags SET account = %s WHERE user_id = %s AND account = %s"
+            for item in range(account, count):
+                cursor.execute(query, (item, userID, item + 1))
+            return tags, tags[: account - 1] + tags[account:]
+
+        previous, tags = await self._run(execute, account)
+        self._bump((userID,), previous)
+        self._cacheUser(userID, tags, previous)
+
+    async def switchPlace(self, userID, account1, account2):
+        """Switch the place of account 1 with 2"""
+
+        def execute(cursor):
+            tags = self._getAllTags(cursor, userID)
+            count = len(tags)
+
+            if (account1 > count or account1 < 1) or (
+                account2 > count or account2 < 1
+            ):
+                raise InvalidArgument
+
+            query = "UPDATE tags SET account = %s WHERE user_id = %s and account = %s"
+            cursor.execute(query, (0, userID, account1))
+            cursor.execute(query, (account1, userID, account2))
+            cursor.execute(query, (account2, userID, 0))
+            tags[account1 - 1], tags[account2 - 1] = (
+                tags[account2 - 1],
+                tags[account1 - 1],
+            )
+            return tags
+
+        tags = await self._run(execute)
+        self._bump((userID,), tags)
+        self._cacheUser(userID, tags)
+
+    async def getUser(self, tag):
+        """Get all users that have this tag, returns dict in list
+
+        [
+            (userID, account)
+        ]
+        """
+        tag = self.formatTag(tag=tag)
+        if not self.verifyTag(tag):
+            raise InvalidTag
+
+        users = self.usersByTag.get(tag)
+        if users is None:
+
+            def execute(cursor):
+                query = "SELECT user_id, account FROM tags WHERE tag = %s"
+                cursor.execute(query, (tag,))
+                return [tuple(row) for row in cursor.fetchall()]
+
+            start = self._startRead()
+            try:
+                users = await self._run(execute)
+                if self._unchanged(start, tags=(tag,)):
+                    self.usersByTag.set(tag, users)
+            finally:
+                self._finishRead(start)
+        return list(users)
+
+    async def getUsersForTags(self, tags):
+        """Get all users for each of the given tags in a single query
+
+        Returns {formatted tag: [(userID, account)]}, invalid tags are skipped
+        """
+        usersByTag = {}
+        missing = []
+        for tag in tags:
+            tag = self.formatTag(tag=tag)
+            if not self.verifyTag(tag) or tag in usersByTag:
+                continue
+            users = self.usersByTag.get(tag)
+            if users is None:
+                missing.append(tag)
+                users = []
+            usersByTag[tag] = list(users)
+        if not missing:
+            return usersByTag
+
+        def execute(cursor):
+            placeholders = ",".join(["%s"] * len(missing))
+            query = f"SELECT tag, user_id, account FROM tags WHERE tag IN ({placeholders})"
+            cursor.execute(query, tuple(missing))
+            return cursor.fetchall()
+
+        start = self._startRead()
+        try:
+            for row in await self._run(execute):
+                usersByTag.setdefault(row[0], []).append((row[1], row[2]))
+            for tag in missing:
+                if self._unchanged(start, tags=(tag,)):
+                    self.usersByTag.set(tag, list(usersByTag[tag]))
+        finally:
+            self._finishRead(start)
+        return usersByTag
+
+    async def moveUserID(self, oldUserID, newUserID):
+        """To be used when a person changes accounts"""
+
+        def execute(cursor):
+            if self._getAllTags(cursor, newUserID):
+                raise MainAlreadySaved
+
+            tags = self._getAllTags(cursor, oldUserID)
+            query = "UPDATE tags SET user_id = %s WHERE user_id = %s"
+            cursor.execute(query, (newUserID, oldUserID))
+            return tags
+
+        tags = await self._run(execute)
+        self._bump((oldUserID, newUserID), tags)
+        self._cacheUser(oldUserID, [], tags)
+        self._cacheUser(newUserID, tags)
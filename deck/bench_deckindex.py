@@ -0,0 +1,55 @@
+"""Benchmark of deck search through DeckIndex against the old full scan.
+
+Needs neither Red nor discord:
+
+    python deck/bench_deckindex.py
+"""
+import random
+import time
+
+from deckindex import DeckId, DeckIndex
+
+DECKS = 100_000
+CARDS = 110
+SEARCHES = 200
+
+
+def scan(decks, cards):
+    """The search deck_search did before the index"""
+    cards = set(cards)
+    return [deck_id for deck_id, deck in decks.items() if cards < set(deck)]
+
+
+def main():
+    rng = random.Random(0)
+    card_keys = ["card-{}".format(i) for i in range(CARDS)]
+    decks = {}
+    for i in range(DECKS):
+        deck_id = DeckId("{:010d}".format(i), i % 20, i % 5000)
+        decks[deck_id] = rng.sample(card_keys, 8)
+
+    start = time.perf_counter()
+    index = DeckIndex()
+    for deck_id, deck in decks.items():
+        index.add(deck_id, deck, "deck")
+    print("build:  {:.2f}s for {} decks".format(time.perf_counter() - start, DECKS))
+
+    queries = [rng.sample(card_keys, rng.randint(1, 3)) for _ in range(SEARCHES)]
+    for query in queries[:20]:
+        assert sorted(index.search(query)) == sorted(scan(decks, query))
+
+    start = time.perf_counter()
+    for query in queries:
+        scan(decks, query)
+    elapsed = time.perf_counter() - start
+    print("scan:   {:.3f}ms per search".format(elapsed / SEARCHES * 1000))
+
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query)
+    elapsed = time.perf_counter() - start
+    print("index:  {:.3f}ms per search".format(elapsed / SEARCHES * 1000))
+
+
+if __name__ == "__main__":
+    main()
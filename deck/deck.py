@@ -24,6 +24,7 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 # force update skeleton dragons 2
+import asyncio
 import datetime
 import datetime as dt
 import io
@@ -33,8 +34,10 @@ import os
 import random
 import re
 import string
+import time
 from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
 
 import aiohttp
 import discord
@@ -46,6 +49,9 @@ from redbot.core.utils.chat_formatting import pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 from redbot.core.utils.predicates import MessagePredicate
 
+from .deckindex import DeckId, DeckIndex
+from .rendercache import RenderCache
+
 credits = "Bot by Legend Gaming"
 credits_icon = "https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1"
 log = logging.getLogger("red.cogs.deck")
@@ -56,6 +62,11 @@ CARDS_JSON_PATH: str = ""
 max_deck_per_user: int = 10
 
 PAGINATION_TIMEOUT = 120
+# How long uploaded image URLs are reused when Discord does not say
+IMAGE_URL_TTL = 7 * 24 * 60 * 60
+# Stop reusing signed URLs this long before they expire
+IMAGE_URL_MARGIN = 60 * 60
+max_image_urls: int = 5000
 HELP_URL = "https://github.com/smlbiobot/SML-Cogs/wiki/Deck#usage"
 CARDS_JSON_URL = "https://royaleapi.github.io/cr-api-data/json/cards.json"
 
@@ -105,6 +116,8 @@ class Deck(commands.Cog):
         )
         default_global = {
             "image_server": dict(guild_id=None, channel_id=None,),
+            "render_cache_disk": False,
+            "image_urls": {},
         }
         default_guild = {
             "decklink": "embed",
@@ -150,6 +163,30 @@ class Deck(commands.Cog):
         # Used for Pillow blocking code
         self.threadex = ThreadPoolExecutor(max_workers=2)
 
+        # Encoded deck images, so repeated decks skip Pillow
+        self.render_cache = RenderCache()
+        self.render_cache_task = self.bot.loop.create_task(self.setup_render_cache())
+
+        # card key -> saved decks, for deck search
+        self.deck_index = DeckIndex()
+        self.deck_index_ready = asyncio.Event()
+        self.deck_index_task = self.bot.loop.create_task(self.build_deck_index())
+
+    async def build_deck_index(self):
+        try:
+            for guild_id, members in (await self.settings.all_members()).items():
+                for member_id, member_data in members.items():
+                    self.deck_index.add_member(guild_id, member_id, member_data["decks"])
+        except Exception:
+            log.exception("Could not build the deck search index, searches may miss decks")
+        finally:
+            # Never leave deck search waiting on an index that will not come
+            self.deck_index_ready.set()
+
+    async def setup_render_cache(self):
+        if await self.settings.render_cache_disk():
+            self.render_cache.disk_path = cog_data_path(self) / "render_cache"
+
     @property
     def valid_card_keys(self) -> List[str]:
         """Valid card keys."""
@@ -222,6 +259,38 @@ class Deck(commands.Cog):
         await self.settings.guild(guild).auto_deck_link.set(auto_deck_link)
         await simple_embed(ctx, "Auto deck link: {}".format(auto_deck_link))
 
+    @deckset.command(name="rendercache")
+    @checks.is_owner()
+    async def deckset_rendercache(self, ctx: commands.Context, clear: bool = False):
+        """Show deck image cache statistics, optionally clearing the cache."""
+        if clear:
+            await self.bot.loop.run_in_executor(self.threadex, self.render_cache.clear)
+        stats = self.render_cache.stats()
+        await simple_embed(
+            ctx,
+            "Entries: {entries} ({size:.1f} MB)\n"
+            "Memory hits: {memory_hits}\n"
+            "Disk hits: {disk_hits}\n"
+            "Misses: {misses}\n"
+            "Disk cache: {disk}".format(
+                size=stats["bytes"] / 1024 / 1024,
+                disk="on" if self.render_cache.disk_path else "off",
+                **stats,
+            ),
+        )
+
+    @deckset.command(name="rendercachedisk")
+    @checks.is_owner()
+    async def deckset_rendercachedisk(self, ctx: commands.Context):
+        """Toggle keeping rendered deck images on disk across restarts."""
+        render_cache_disk = not await self.settings.render_cache_disk()
+        await self.settings.render_cache_disk.set(render_cache_disk)
+        if render_cache_disk:
+            self.render_cache.disk_path = cog_data_path(self) / "render_cache"
+        else:
+            self.render_cache.disk_path = None
+        await simple_embed(ctx, "Disk render cache: {}".format(render_cache_disk))
+
     async def decklink_settings(self, guild: discord.Guild):
         """embed, link, none. Default: embed"""
         default = "embed"
@@ -411,16 +480,21 @@ class Deck(commands.Cog):
                             + str(len(member_decks))
                             + str(random.choice(range(1000)))
                         )
-                    member_decks[str(datetime.datetime.utcnow())] = {
+                    added = str(datetime.datetime.utcnow())
+                    member_decks[added] = {
                         "Deck": member_deck,
                         "DeckName": deck_name,
                     }
+                    self.deck_index.add(
+                        DeckId(added, ctx.guild.id, author.id), member_deck, deck_name
+                    )
                     timestamp = member_decks.keys()
                     timestamp = sorted(timestamp)
 
                     while len(member_decks) > max_deck_per_user:
                         t = timestamp.pop(0)
                         member_decks.pop(t, None)
+                        self.deck_index.remove(DeckId(t, ctx.guild.id, author.id))
                     await simple_embed(ctx, "Deck added.")
 
     @deck.command(name="addlink", aliases=["al", "import", "i"])
@@ -614,49 +688,36 @@ class Deck(commands.Cog):
         if not len(params):
             await simple_embed(ctx, "You must enter at least one card to search.")
             return
-        all_members_data = list((await self.settings.all_members()).values())
+        await self.deck_index_ready.wait()
         # normalize params
         params = self.normalize_deck_data(params)
-        found_decks = []
-        for member_data in all_members_data:
-            for member_id, server_member in member_data.items():
-                member_decks = server_member["decks"]
-                member_id = member_id
-                member = self.bot.get_user(member_id)
-                if member:
-                    member_display_name = member.getattr("display_name", None)
-                else:
-                    member = member_id
-                    member_display_name = member_id
-                for k, member_deck in member_decks.items():
-                    cards = member_deck["Deck"]
-                    # await self.bot.say(set(params))
-                    if set(params) < set(cards):
-                        found_decks.append(
-                            {
-                                "UTC": k,
-                                "Deck": member_deck["Deck"],
-                                "DeckName": member_deck["DeckName"],
-                                "Member": member,
-                                "MemberDisplayName": member_display_name,
-                            }
-                        )
-        found_decks = sorted(found_decks, key=lambda x: x["UTC"], reverse=True)
+        found_decks = self.deck_index.search(params)
 
         await ctx.send("Found {} decks".format(len(found_decks)))
         if len(found_decks):
             results_max = 3
             deck_id = 1
-            for deck in found_decks:
-                timestamp = deck["UTC"][:19]
+            for found_deck in found_decks:
+                # Only the decks actually shown are looked up
+                cards, deck_name = self.deck_index.decks.get(found_deck, (None, None))
+                if cards is None:
+                    # Removed while paging
+                    continue
+                member = self.bot.get_user(found_deck.member_id)
+                if member:
+                    member_display_name = getattr(member, "display_name", None)
+                else:
+                    member = found_deck.member_id
+                    member_display_name = found_deck.member_id
+                timestamp = found_deck.timestamp[:19]
                 description = "**{}. {}** by {} — {}".format(
-                    deck_id, deck["DeckName"], deck["MemberDisplayName"], timestamp
+                    deck_id, deck_name, member_display_name, timestamp
                 )
                 await self.upload_deck_image(
                     ctx,
-                    deck["Deck"],
-                    deck["DeckName"],
-                    deck["Member"],
+                    list(cards),
+                    deck_name,
+                    member,
                     description=description,
                 )
                 deck_id += 1
@@ -687,9 +748,12 @@ class Deck(commands.Cog):
             if deck_id >= len(member_decks):
                 await simple_embed(ctx, "The deck id you have entered is invalid.")
                 return
-            for i, deck in enumerate(member_decks.values()):
+            for i, (added, deck) in enumerate(member_decks.items()):
                 if deck_id == i:
                     deck["DeckName"] = new_name
+                    self.deck_index.rename(
+                        DeckId(added, ctx.guild.id, author.id), new_name
+                    )
             await simple_embed(ctx, "Deck renamed to {}.".format(new_name))
             await self.deck_upload(ctx, deck["Deck"], new_name, author)
 
@@ -710,6 +774,7 @@ class Deck(commands.Cog):
                         if deck_id == i:
                             remove_key = key
                     member_decks.pop(remove_key)
+                    self.deck_index.remove(DeckId(remove_key, ctx.guild.id, author.id))
                     await simple_embed(ctx, "Deck {} removed.".format(deck_id + 1))
 
     @deck.command(name="help")
@@ -762,18 +827,14 @@ class Deck(commands.Cog):
     ):
         """Upload deck image to the server."""
 
-        deck_image = await self.bot.loop.run_in_executor(
-            None, self.get_deck_image, deck, deck_name, author
-        )
+        deck_png = await self.get_deck_png(deck, deck_name, author)
 
         # construct a filename using first three letters of each card
         filename = "deck-{}.png".format("-".join([card[:3] for card in deck]))
 
         message = None
 
-        with io.BytesIO() as f:
-            deck_image.save(f, "PNG")
-            f.seek(0)
+        with io.BytesIO(deck_png) as f:
             timestamp = embed_params.pop("timestamp", dt.datetime.utcnow())
             embed = discord.Embed(timestamp=timestamp, **embed_params,)
             embed.set_image(url="attachment://{}".format(filename))
@@ -788,18 +849,14 @@ class Deck(commands.Cog):
         self, channel, deck, deck_name, author, **embed_params
     ):
         """Upload deck image to destination."""
-        deck_image = await self.bot.loop.run_in_executor(
-            None, self.get_deck_image, deck, deck_name, author
-        )
+        deck_png = await self.get_deck_png(deck, deck_name, author)
 
         # construct a filename using first three letters of each card
         filename = "deck-{}.png".format("-".join([card[:3] for card in deck]))
 
         message = None
 
-        with io.BytesIO() as f:
-            deck_image.save(f, "PNG")
-            f.seek(0)
+        with io.BytesIO(deck_png) as f:
             timestamp = embed_params.pop("timestamp", dt.datetime.utcnow())
             embed = discord.Embed(timestamp=timestamp, **embed_params)
             embed.set_image(url="attachment://{}".format(filename))
@@ -829,6 +886,70 @@ class Deck(commands.Cog):
 
         return average_elixir
 
+    @staticmethod
+    def get_deck_author_name(deck_author):
+        if deck_author:
+            if isinstance(deck_author, str):
+                return deck_author
+            elif hasattr(deck_author, "display_name"):
+                return deck_author.display_name
+        return ""
+
+    def deck_signature(self, deck, deck_name=None, deck_author=None) -> str:
+        """Identifies the image rendered for these arguments."""
+        return self.render_cache.key(
+            deck,
+            deck_name=deck_name or "Deck",
+            deck_author=self.get_deck_author_name(deck_author),
+        )
+
+    @staticmethod
+    def image_url_expiry(url, stored_at) -> float:
+        """Time after which an uploaded image URL should not be reused."""
+        expires = parse_qs(urlparse(url).query).get("ex")
+        if expires:
+            try:
+                return int(expires[0], 16) - IMAGE_URL_MARGIN
+            except ValueError:
+                pass
+        return stored_at + IMAGE_URL_TTL
+
+    async def get_image_url(self, signature) -> Optional[str]:
+        """Previously uploaded URL for a deck image, if still usable."""
+        entry = (await self.settings.image_urls()).get(signature)
+        if entry is None or time.time() >= entry["expires"]:
+            return None
+        return entry["url"]
+
+    async def save_image_url(self, signature, url):
+        now = time.time()
+        async with self.settings.image_urls() as image_urls:
+            for key in [k for k, v in image_urls.items() if now >= v["expires"]]:
+                image_urls.pop(key)
+            image_urls[signature] = dict(url=url, expires=self.image_url_expiry(url, now))
+            if len(image_urls) > max_image_urls:
+                oldest = sorted(image_urls, key=lambda k: image_urls[k]["expires"])
+                for key in oldest[: len(image_urls) - max_image_urls]:
+                    image_urls.pop(key)
+
+    async def get_deck_png(self, deck, deck_name=None, deck_author=None) -> bytes:
+        """Deck image as PNG bytes, rendered only if not cached."""
+        key = self.deck_signature(deck, deck_name, deck_author)
+        return await self.bot.loop.run_in_executor(
+            self.threadex, self.render_deck_png, key, deck, deck_name, deck_author
+        )
+
+    def render_deck_png(self, key, deck, deck_name=None, deck_author=None) -> bytes:
+        data = self.render_cache.get(key)
+        if data is None:
+            deck_image = self.get_deck_image(deck, deck_name, deck_author)
+            with io.BytesIO() as f:
+                deck_image.save(f, "PNG")
+                data = f.getvalue()
+            deck_image.close()
+            self.render_cache.put(key, data)
+        return data
+
     def get_deck_image(self, deck, deck_name=None, deck_author=None):
         """Construct the deck with Pillow and return image."""
         card_w = 302
@@ -905,15 +1026,7 @@ class Deck(commands.Cog):
         line2 = ", ".join(card_names[4:])
         # card_text = '\n'.join([line0, line1])
 
-        if deck_author:
-            if isinstance(deck_author, str):
-                deck_author_name = deck_author
-            elif hasattr(deck_author, "display_name"):
-                deck_author_name = deck_author.display_name
-            else:
-                deck_author_name = ""
-        else:
-            deck_author_name = ""
+        deck_author_name = self.get_deck_author_name(deck_author)
 
         # deck_author_name = deck_author.name if deck_author else ""
 
@@ -1026,22 +1139,29 @@ class Deck(commands.Cog):
         if img_channel_id:
             img_channel = self.bot.get_channel(img_channel_id)
             if img_channel:
-                url = await self.decklink_url(card_keys, war=False)
-                img_msg = await self.upload_deck_image_to(
-                    img_channel,
-                    card_keys,
-                    deck_name,
-                    deck_author or self.bot.name,
-                    title="Copy deck",
-                    url=url,
+                # Only decks not uploaded before need a render and upload
+                signature = self.deck_signature(
+                    card_keys, deck_name, deck_author or self.bot.name
                 )
-                if len(img_msg.attachments) != 0:
-                    img_url = img_msg.attachments[0].url
-                elif len(img_msg.embeds) != 0:
-                    img_url = img_msg.embeds[0].image.url
-                else:
-                    await channel.send("Cannot get url for deck.")
-                    return
+                img_url = await self.get_image_url(signature)
+                if img_url is None:
+                    url = await self.decklink_url(card_keys, war=False)
+                    img_msg = await self.upload_deck_image_to(
+                        img_channel,
+                        card_keys,
+                        deck_name,
+                        deck_author or self.bot.name,
+                        title="Copy deck",
+                        url=url,
+                    )
+                    if len(img_msg.attachments) != 0:
+                        img_url = img_msg.attachments[0].url
+                    elif len(img_msg.embeds) != 0:
+                        img_url = img_msg.embeds[0].image.url
+                    else:
+                        await channel.send("Cannot get url for deck.")
+                        return
+                    await self.save_image_url(signature, img_url)
                 if link is not None:
                     url = link
                 else:
@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+
+class DeckId(NamedTuple):
+    """Where a saved deck lives in Config."""
+
+    timestamp: str
+    guild_id: int
+    member_id: int
+
+
+class DeckIndex:
+    """Inverted index from card key to the saved decks containing it.
+
+    Searching intersects the posting lists of the searched cards, starting
+    with the shortest, so the cost depends on how many decks contain the
+    rarest card rather than on how many decks are stored.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[DeckId]] = {}
+        self.decks: Dict[DeckId, Tuple[Tuple[str, ...], str]] = {}
+
+    def __len__(self):
+        return len(self.decks)
+
+    def add(self, deck_id: DeckId, cards: Iterable[str], name: str):
+        self.remove(deck_id)
+        cards = tuple(cards)
+        self.decks[deck_id] = (cards, name)
+        for card in set(cards):
+            self.postings.setdefault(card, set()).add(deck_id)
+
+    def remove(self, deck_id: DeckId):
+        entry = self.decks.pop(deck_id, None)
+        if entry is None:
+            return
+        for card in set(entry[0]):
+            posting = self.postings.get(card)
+            if posting is None:
+                continue
+            posting.discard(deck_id)
+            if not posting:
+                del self.postings[card]
+
+    def rename(self, deck_id: DeckId, name: str):
+        entry = self.decks.get(deck_id)
+        if entry is not None:
+            self.decks[deck_id] = (entry[0], name)
+
+    def add_member(self, guild_id: int, member_id: int, member_decks: dict):
+        for timestamp, deck in member_decks.items():
+            self.add(DeckId(timestamp, guild_id, member_id), deck["Deck"], deck["DeckName"])
+
+    def search(self, cards: Iterable[str]) -> List[DeckId]:
+        """Decks containing all cards (and at least one more), newest first."""
+        cards = set(cards)
+        if not cards:
+            return []
+        postings = sorted(
+            (self.postings.get(card, set()) for card in cards), key=len
+        )
+        found = set(postings[0])
+        for posting in postings[1:]:
+            if not found:
+                break
+            found &= posting
+        # Same as the original set(params) < set(cards) search
+        found = [deck_id for deck_id in found if len(set(self.decks[deck_id][0])) > len(cards)]
+        return sorted(found, key=lambda deck_id: deck_id.timestamp, reverse=True)
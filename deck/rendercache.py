@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+class RenderCache:
+    """Content addressed cache of encoded deck images.
+
+    Entries are PNG bytes keyed by a hash of the ordered card keys and the
+    render options. A memory LRU bounded by total size sits in front of an
+    optional directory of PNG files, which is trimmed to max_disk_bytes by
+    deleting the least recently used files (oldest mtime) first.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        disk_path: Optional[Path] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        # Size of the files in _disk_size_path, None until counted
+        self._disk_size = None
+        self._disk_size_path = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(card_keys, **options) -> str:
+        """Stable key for the given cards and render options."""
+        parts = [",".join(card_keys)]
+        parts.extend("{}={}".format(k, options[k]) for k in sorted(options))
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def _disk_file(self, key) -> Optional[Path]:
+        if self.disk_path is None:
+            return None
+        return self.disk_path / "{}.png".format(key)
+
+    def _remember(self, key, data: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key) -> Optional[bytes]:
+        """Cached bytes for key or None. Blocking when the disk tier is used."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return data
+        disk_file = self._disk_file(key)
+        if disk_file is not None and disk_file.exists():
+            data = disk_file.read_bytes()
+            try:
+                # Marks the file as recently used for trimming
+                os.utime(str(disk_file))
+            except OSError:
+                pass
+            self._remember(key, data)
+            with self._lock:
+                self.disk_hits += 1
+            return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data: bytes):
+        """Store bytes for key. Blocking when the disk tier is used."""
+        self._remember(key, data)
+        disk_file = self._disk_file(key)
+        if disk_file is None:
+            return
+        disk_file.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so a crash never leaves a truncated PNG behind
+        tmp_file = disk_file.with_name("{}.{}.tmp".format(disk_file.name, threading.get_ident()))
+        existed = disk_file.exists()
+        tmp_file.write_bytes(data)
+        os.replace(str(tmp_file), str(disk_file))
+        with self._lock:
+            if self._disk_size_path != disk_file.parent:
+                self._disk_size = sum(f.stat().st_size for f in disk_file.parent.glob("*.png"))
+                self._disk_size_path = disk_file.parent
+            elif not existed:
+                self._disk_size += len(data)
+            if self._disk_size > self.max_disk_bytes:
+                self._trim_disk(disk_file.parent)
+
+    def _trim_disk(self, path: Path):
+        """Delete the oldest files until the directory is at 90% of its limit"""
+        files = []
+        for disk_file in path.glob("*.png"):
+            try:
+                stat = disk_file.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, disk_file))
+        files.sort()
+        size = sum(f[1] for f in files)
+        for _, file_size, disk_file in files:
+            if size <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                disk_file.unlink()
+            except OSError:
+                continue
+            size -= file_size
+        self._disk_size = size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.disk_path is not None and self.disk_path.exists():
+            for disk_file in self.disk_path.glob("*.png"):
+                disk_file.unlink()
+            for disk_file in self.disk_path.glob("*.tmp"):
+                disk_file.unlink()
+        with self._lock:
+            self._disk_size = None
+            self._disk_size_path = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                bytes=self._size,
+                memory_hits=self.memory_hits,
+                disk_hits=self.disk_hits,
+                misses=self.misses,
+            )
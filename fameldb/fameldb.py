@@ -1,15 +1,20 @@
 import discord
 import asyncio
 import aiohttp
+import json
 from discord import embeds
 from discord.message import Message
 from redbot.core import commands, Config, checks
 import copy
+from contextvars import ContextVar
 
 
 sleep_time = 900
 fame_emoji = "<:fame:757940151845519411>"
 donations_emoji = "<:donations:844657488389472338>"
+# Request counter of the update cycle running in the current task, None
+# outside update_embed so commands like topfame are not counted
+cycle_requests = ContextVar("cycle_requests", default=None)
 
 
 class FameLeaderboard(commands.Cog):
@@ -18,6 +23,12 @@ class FameLeaderboard(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.tags = self.bot.get_cog('ClashRoyaleTools').tags
+        # Shared by every request, created with the API token by crtoken
+        self.session = None
+        # API requests made by the last update cycle
+        self.last_cycle_requests = None
+        # message id -> hash of the embed it currently shows
+        self.published = {}
         self.update_embed_task = bot.loop.create_task(self.update_embed())
         self.config = Config.get_conf(self, identifier=2345341233)
         default_settings = {"main": {"server_id": None,
@@ -116,88 +127,54 @@ class FameLeaderboard(commands.Cog):
         try:
             await asyncio.sleep(10)  # Start-up Time
             while True:
+                requests = {'count': 0}
+                cycle_requests.set(requests)
                 main = await self.config.main()
                 clans = await self.config.clan_servers()
                 main_embed, clan_embeds = await self.get_data_fame()
+                main_update = {}
+                clan_updates = {}
                 if main['use'] == True:
-                    main_guild_id = main['server_id']
-                    main_channel_id = main["channel_id"]
-                    main_guild = self.bot.get_guild(main_guild_id)
-                    main_channel = main_guild.get_channel(main_channel_id)
-                    if main.get('last_message_id') == None:
-                        message = await main_channel.send(embed=main_embed)
-                        async with self.config.main() as data:
-                            data['last_message_id'] = message.id
-                    else:
-                        last_mes_id = main['last_message_id']
-                        try:
-                            message = await main_channel.fetch_message(last_mes_id)
-                            await message.delete()
-                        except Exception as e:
-                            async with self.config.main() as data:
-                                data['last_message_id'] = None
-                            print(e)
-                        message = await main_channel.send(embed=main_embed)
-                        async with self.config.main() as data:
-                            data['last_message_id'] = message.id
+                    main_guild = self.bot.get_guild(main['server_id'])
+                    main_channel = main_guild.get_channel(main["channel_id"])
+                    message_id = await self.publish(
+                        main_channel, main.get('last_message_id'), main_embed)
+                    if message_id != main.get('last_message_id'):
+                        main_update['last_message_id'] = message_id
                 if clan_embeds != None:
                     for clan in clans:
                         x = clans[clan]
-                        if clans[clan]['use'] == True:
-                            clan_guild = self.bot.get_guild(
-                                clans[clan]['server_id'])
-                            clan_channel = clan_guild.get_channel(
-                                clans[clan]['channel_id'])
-                            if x.get('last_message_id') == None:
-                                # some edge case scenario
-                                if clan_embeds.get(clans[clan]['tag']) == None:
-                                    pass
-                                else:
-                                    clan_emb = clan_embeds[clans[clan]['tag']]
-                                    message = await clan_channel.send(embed=clan_emb)
-                                    async with self.config.clan_servers() as data:
-                                        data[clan]['last_message_id'] = message.id
-                            else:
-                                # some edge case scenario
-                                if clan_embeds.get(clans[clan]['tag']) == None:
-                                    pass
-                                else:
-                                    last_mes_id = clans[clan]['last_message_id']
-                                    try:
-                                        message = await clan_channel.fetch_message(last_mes_id)
-                                        await message.delete()
-                                    except Exception as e:
-                                        print(e)
-                                    clan_emb = clan_embeds[clans[clan]['tag']]
-                                    message = await clan_channel.send(embed=clan_emb)
-                                    async with self.config.clan_servers() as data:
-                                        data[clan]['last_message_id'] = message.id
+                        # some edge case scenario
+                        if x['use'] != True or clan_embeds.get(x['tag']) == None:
+                            continue
+                        clan_guild = self.bot.get_guild(x['server_id'])
+                        clan_channel = clan_guild.get_channel(x['channel_id'])
+                        message_id = await self.publish(
+                            clan_channel, x.get('last_message_id'), clan_embeds[x['tag']])
+                        if message_id != x.get('last_message_id'):
+                            clan_updates.setdefault(clan, {})['last_message_id'] = message_id
                 empire_data = clans['LeGeND Empire!']
                 if empire_data.get('use') == True:
                     try:
                         to_send = await self.empire_losers()
+                        emp = self.bot.get_guild(empire_data['server_id'])
+                        channel_to_send = emp.get_channel(
+                            empire_data.get('channel_id'))
+                        message_id = await self.publish(
+                            channel_to_send, empire_data.get('last_reverse'), to_send)
+                        if message_id != empire_data.get('last_reverse'):
+                            clan_updates.setdefault('LeGeND Empire!', {})['last_reverse'] = message_id
                     except Exception as e:
                         print(e)
-                    emp = self.bot.get_guild(
-                        clans['LeGeND Empire!']['server_id'])
-                    channel_to_send = emp.get_channel(
-                        empire_data.get('channel_id'))
-                    if empire_data.get('last_reverse') == None:
-                        try:
-                            message = await channel_to_send.send(embed=to_send)
-                        except Exception as e:
-                            print(e)
-                        async with self.config.clan_servers() as clan:
-                            clan['LeGeND Empire!']['last_reverse'] = message.id
-                    else:
-                        try:
-                            message = await channel_to_send.fetch_message(empire_data.get('last_reverse'))
-                            await message.delete()
-                        except Exception as e:
-                            print(e)
-                        message = await channel_to_send.send(embed=to_send)
-                        async with self.config.clan_servers() as clan:
-                            clan['LeGeND Empire!']['last_reverse'] = message.id
+                # Message ids only change when a message had to be resent
+                if main_update:
+                    async with self.config.main() as data:
+                        data.update(main_update)
+                if clan_updates:
+                    async with self.config.clan_servers() as data:
+                        for clan, update in clan_updates.items():
+                            data[clan].update(update)
+                self.last_cycle_requests = requests['count']
                 # Run Every X seconds
                 await asyncio.sleep(sleep_time)
         except asyncio.CancelledError:
@@ -211,16 +188,63 @@ class FameLeaderboard(commands.Cog):
                 "CR Token is not SET. Use !set api clashroyale token,YOUR_TOKEN to set it")
             raise RuntimeError
         self.headers = {'authorization': 'Bearer {}'.format(token['token'])}
+        if self.session is None:
+            self.session = aiohttp.ClientSession(headers=self.headers)
 
     def cog_unload(self):
         self.update_embed_task.cancel()
-
-    async def ldb_to_emb(self, ldb, base_embed, clan_spec: bool = False):
+        if self.session:
+            self.bot.loop.create_task(self.session.close())
+
+    async def publish(self, channel, message_id, embed):
+        """Show embed in channel, returns the id of the message showing it
+
+        The existing message is edited in place, the edit is skipped when the
+        embed did not change since it was last published, and a new message is
+        only sent when there is no message to edit.
+        """
+        embed_hash = hash(json.dumps(embed.to_dict(), sort_keys=True))
+        if message_id is not None:
+            if self.published.get(message_id) == embed_hash:
+                return message_id
+            try:
+                await channel.get_partial_message(message_id).edit(embed=embed)
+                self.published[message_id] = embed_hash
+                return message_id
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                print(e)
+                return message_id
+            self.published.pop(message_id, None)
+        message = await channel.send(embed=embed)
+        self.published[message.id] = embed_hash
+        return message.id
+
+    async def api_get(self, url):
+        """GET a Clash Royale API url, returns (status, json or None)"""
+        if self.session is None:
+            await self.crtoken()
+        requests = cycle_requests.get()
+        if requests is not None:
+            requests['count'] += 1
+        async with self.session.get(url) as resp:
+            if resp.status != 200:
+                return resp.status, None
+            return resp.status, await resp.json()
+
+    async def ldb_to_emb(self, ldb, base_embed, clan_names, clan_spec: bool = False):
         # This all looks weird but it's embed formatting
         pos = 25
         if clan_spec == True:
             pos = 4
         podium = ['🥇', '🥈', '🥉']
+        users_by_tag = {}
+        try:
+            users_by_tag = await self.tags.getUsersForTags(
+                [memb['tag'] for memb in ldb[:pos + 1]])
+        except Exception as e:
+            print(e)
         for i, memb in enumerate(ldb):
             if(i > pos):
                 break
@@ -232,26 +256,13 @@ class FameLeaderboard(commands.Cog):
 
             # Find discord user
             value = ''
-            try:
-                users = self.tags.getUser(memb['tag'].strip('#'))
-                for user in users:
-                    value += f'<@{user[0]}> - '
-            except Exception as e:
-                print(e)
+            for user in users_by_tag.get(self.tags.formatTag(memb['tag']), []):
+                value += f'<@{user[0]}> - '
 
-            # Get Clan
+            # Clan is the one whose river race the player fought in
             clan = ''
-            uurl = 'https://proxy.royaleapi.dev/v1/players/%23{}/'.format(
-                memb['tag'].strip('#'))
-            async with aiohttp.ClientSession() as client:
-                async with client.get(uurl, headers=self.headers) as resp:
-                    if(resp.status != 200):
-                        return discord.Embed(title='Clash Royale API Error', description='Clash Royale API is offline... data cannot be retreived :(')
-                    data = await resp.json()
-                    try:
-                        clan = f"| {data['clan']['name']}"
-                    except Exception:
-                        clan = ''
+            if memb['tag'] in clan_names:
+                clan = f"| {clan_names[memb['tag']]}"
 
             value += f"{memb['name']} ({memb['tag']}) {clan}"
             base_embed.add_field(name=title, value=value, inline=False)
@@ -268,28 +279,31 @@ class FameLeaderboard(commands.Cog):
 
         members = []  # Runs in O(n log n) where n is the amount of members
         clan_mem_dict = dict()
+        clan_names = dict()  # participant tag -> clan name
         legend_clans = await self.config.clan_servers()
-        for clan_data in legend_clans:
-            if legend_clans[clan_data]['tag'] == "9PJYVVL2":
-                continue 
-            url = 'https://proxy.royaleapi.dev/v1/clans/%23{}/currentriverrace'.format(
-                legend_clans[clan_data]['tag'])
-            async with aiohttp.ClientSession() as client:
-                async with client.get(url, headers=self.headers) as resp:
-                    if(resp.status != 200):
-                        return discord.Embed(title=f'Clash Royale API Error({legend_clans[clan_data]["tag"]})', description='Clash Royale API is offline... data cannot be retreived :('), None
-                    data = await resp.json()
-                    members.extend(data['clan']['participants'])
-                    if legend_clans[clan_data]['use'] == True:
-                        clan_mems = data['clan']['participants']
-                        sorted_clan_mems = sorted(
-                            clan_mems, key=lambda x: x['fame'], reverse=True)
-                        clan_mem_dict[legend_clans[clan_data]
-                                      ['tag']] = sorted_clan_mems
+        clan_keys = [clan_data for clan_data in legend_clans
+                     if legend_clans[clan_data]['tag'] != "9PJYVVL2"]
+        # Fetch every clan's river race at once
+        responses = await asyncio.gather(*(
+            self.api_get('https://proxy.royaleapi.dev/v1/clans/%23{}/currentriverrace'.format(
+                legend_clans[clan_data]['tag']))
+            for clan_data in clan_keys))
+        for clan_data, (status, data) in zip(clan_keys, responses):
+            if(status != 200):
+                return discord.Embed(title=f'Clash Royale API Error({legend_clans[clan_data]["tag"]})', description='Clash Royale API is offline... data cannot be retreived :('), None
+            members.extend(data['clan']['participants'])
+            for participant in data['clan']['participants']:
+                clan_names[participant['tag']] = data['clan']['name']
+            if legend_clans[clan_data]['use'] == True:
+                clan_mems = data['clan']['participants']
+                sorted_clan_mems = sorted(
+                    clan_mems, key=lambda x: x['fame'], reverse=True)
+                clan_mem_dict[legend_clans[clan_data]
+                              ['tag']] = sorted_clan_mems
 
         # sorts in descending order
         ldb = sorted(members, key=lambda member: -member['fame'])
-        main_emb = await self.ldb_to_emb(ldb=ldb, base_embed=embed)
+        main_emb = await self.ldb_to_emb(ldb=ldb, base_embed=embed, clan_names=clan_names)
         if len(clan_mem_dict) == 0:
             return main_emb, None
         else:
@@ -303,61 +317,54 @@ class FameLeaderboard(commands.Cog):
                             url="https://static.wikia.nocookie.net/clashroyale/images/9/9f/War_Shield.png/revision/latest?cb=20180425130200")
                         embed.set_footer(text="Bot by: Legend Dev Team",
                                          icon_url="https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1")
-                        em = await self.ldb_to_emb(ldb=clan_mem_dict[tag], base_embed=embed, clan_spec=True)
+                        em = await self.ldb_to_emb(ldb=clan_mem_dict[tag], base_embed=embed, clan_names=clan_names, clan_spec=True)
                         embed_dict[tag] = em
             return main_emb, embed_dict
 
     async def check_membership(self, riverrace_data):
         url = 'https://proxy.royaleapi.dev/v1/clans/%239P2PQULQ/members'
-        async with aiohttp.ClientSession() as client:
-            async with client.get(url=url, headers=self.headers) as resp:
-                data = await resp.json()
-                member_list = data['items']
-            found_members = []
-            for member in riverrace_data:
-                tag = member['tag']
-                for clan_mem in member_list:
-                    if tag == clan_mem['tag']:
-                        found_members.append(member)
-                        break
-            final = sorted(found_members, key=lambda x: x['fame'])
-            return final
-
-    def embed_for_bottom(self, rectified_data, base_embed):
+        status, data = await self.api_get(url)
+        member_tags = {clan_mem['tag'] for clan_mem in data['items']}
+        found_members = [member for member in riverrace_data
+                         if member['tag'] in member_tags]
+        final = sorted(found_members, key=lambda x: x['fame'])
+        return final
+
+    async def embed_for_bottom(self, rectified_data, base_embed):
+        users_by_tag = {}
+        try:
+            users_by_tag = await self.tags.getUsersForTags(
+                [memb['tag'] for memb in rectified_data[:5]])
+        except Exception as e:
+            print(e)
         for i, memb in enumerate(rectified_data):
             if(i > 4):
                 break
             title = str(50-i)
             title += ' - ' + str(memb['fame']) + fame_emoji
             value = ''
-            try:
-                users = self.tags.getUser(memb['tag'].strip('#'))
-                for user in users:
-                    value += f'<@{user[0]}> - '
-            except Exception as e:
-                print(e)
+            for user in users_by_tag.get(self.tags.formatTag(memb['tag']), []):
+                value += f'<@{user[0]}> - '
             value += f"{memb['name']} ({memb['tag']})"
             base_embed.add_field(name=title, value=value, inline=False)
         return base_embed
 
     async def empire_losers(self):
         url = 'https://proxy.royaleapi.dev/v1/clans/%239P2PQULQ/currentriverrace'
-        async with aiohttp.ClientSession() as client:
-            async with client.get(url=url, headers=self.headers) as resp:
-                if(resp.status != 200):
-                    return discord.Embed(title='Clash Royale API Error', description='Clash Royale API is offline... data cannot be retreived :(')
-                data = await resp.json()
-                participants = data['clan']['participants']
-                members_in_clan = await self.check_membership(participants)
-                embed = discord.Embed(title=f"Legend Empire Lowest Fame Contributors",
-                                            description=f'These are the lowest fame contributers from LeGeND Empire! in the current ricer race, they are even worse than Sai Namrath LMAO.', color=discord.Color.red())
-                embed.set_thumbnail(
-                    url="https://static.wikia.nocookie.net/clashroyale/images/9/9f/War_Shield.png/revision/latest?cb=20180425130200")
-                embed.set_footer(text="Bot by: Legend Dev Team",
-                                 icon_url="https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1")
-                embed = self.embed_for_bottom(
-                    members_in_clan, base_embed=embed)
-                return embed
+        status, data = await self.api_get(url)
+        if(status != 200):
+            return discord.Embed(title='Clash Royale API Error', description='Clash Royale API is offline... data cannot be retreived :(')
+        participants = data['clan']['participants']
+        members_in_clan = await self.check_membership(participants)
+        embed = discord.Embed(title=f"Legend Empire Lowest Fame Contributors",
+                                    description=f'These are the lowest fame contributers from LeGeND Empire! in the current ricer race, they are even worse than Sai Namrath LMAO.', color=discord.Color.red())
+        embed.set_thumbnail(
+            url="https://static.wikia.nocookie.net/clashroyale/images/9/9f/War_Shield.png/revision/latest?cb=20180425130200")
+        embed.set_footer(text="Bot by: Legend Dev Team",
+                         icon_url="https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1")
+        embed = await self.embed_for_bottom(
+            members_in_clan, base_embed=embed)
+        return embed
 
     @commands.command()
     async def topfame(self, ctx):
@@ -366,6 +373,12 @@ class FameLeaderboard(commands.Cog):
             embed, _ = await self.get_data_fame()
             await ctx.send(embed=embed)
 
+    @commands.command()
+    @checks.is_owner()
+    async def famerequests(self, ctx):
+        """Show how many API requests the last leaderboard update made"""
+        await ctx.send(f"Last update cycle made {self.last_cycle_requests} API requests")
+
     @commands.command()
     @checks.is_owner()
     async def setfamechannel(self, ctx, nick='main'):
@@ -442,7 +455,7 @@ class FameLeaderboard(commands.Cog):
             # Find discord user
             value = ''
             try:
-                users = self.tags.getUser(memb['tag'].strip('#'))
+                users = await self.tags.getUser(memb['tag'].strip('#'))
                 for user in users:
                     value += f'<@{user[0]}> - '
             except Exception as e:
@@ -0,0 +1,59 @@
+"""Benchmark of EmojiIndex against scanning every emoji of the bot.
+
+Needs neither Red nor discord:
+
+    python nonitroemoji/bench_emojiindex.py
+"""
+import random
+import string
+import time
+from types import SimpleNamespace
+
+from emojiindex import EmojiIndex
+
+EMOJIS = 5000
+LOOKUPS = 2000
+
+
+def scan(emojis, name):
+    for emoji in emojis:
+        if emoji.name.lower() == name.lower() and emoji.available:
+            return emoji
+    return None
+
+
+def main():
+    rng = random.Random(0)
+    emojis = [
+        SimpleNamespace(
+            name="".join(rng.choice(string.ascii_letters) for _ in range(8)),
+            available=rng.random() > 0.1,
+        )
+        for _ in range(EMOJIS)
+    ]
+    names = [rng.choice(emojis).name.upper() for _ in range(LOOKUPS // 2)]
+    names += ["missing{}".format(i) for i in range(LOOKUPS // 2)]
+
+    start = time.perf_counter()
+    index = EmojiIndex(emojis)
+    build = time.perf_counter() - start
+    for name in names:
+        assert index.get(name) is scan(emojis, name), name
+
+    start = time.perf_counter()
+    for name in names:
+        scan(emojis, name)
+    scanned = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in names:
+        index.get(name)
+    indexed = time.perf_counter() - start
+
+    print("build: {:.3f}ms for {} emojis".format(build * 1000, EMOJIS))
+    print("scan: {:.3f}us per lookup".format(scanned / LOOKUPS * 1e6))
+    print("index: {:.3f}us per lookup".format(indexed / LOOKUPS * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+class EmojiIndex:
+    """Case insensitive lookup of available emojis by name.
+
+    When several emojis share a name the first available one wins, like the
+    scan over ``bot.emojis`` this replaces.
+    """
+
+    def __init__(self, emojis):
+        self.emojis = {}
+        for emoji in emojis:
+            if emoji.available:
+                self.emojis.setdefault(emoji.name.lower(), emoji)
+
+    def get(self, name):
+        return self.emojis.get(name.lower())
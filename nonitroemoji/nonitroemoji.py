@@ -3,15 +3,61 @@ from discord.errors import InvalidArgument
 from redbot.core import commands, Config, checks
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 
+from .emojiindex import EmojiIndex
+
 class NonNitroEmoji(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=3454353423)
         default_global = {'data': {'guild_id': 599090817704919041}}
         self.config.register_global(**default_global)
+        # Rebuilt when set back to None by one of the listeners below
+        self.emoji_index = None
+        # channel id -> "bot_emoji" webhook of the channel
+        self.webhooks = {}
+
+    def get_emoji(self, name):
+        if self.emoji_index is None:
+            self.emoji_index = EmojiIndex(self.bot.emojis)
+        return self.emoji_index.get(name)
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild, before, after):
+        self.emoji_index = None
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before, after):
+        # Boosts change how many emojis are available
+        if before.premium_tier != after.premium_tier:
+            self.emoji_index = None
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.emoji_index = None
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.emoji_index = None
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel):
+        self.webhooks.pop(channel.id, None)
+
+    async def get_webhook(self, channel):
+        webhook_to_send = self.webhooks.get(channel.id)
+        if webhook_to_send is not None:
+            return webhook_to_send
+        for webhook in await channel.webhooks():
+            if webhook.name == "bot_emoji":
+                webhook_to_send = webhook
+                break
+        if webhook_to_send is None:
+            webhook_to_send = await channel.create_webhook(name="bot_emoji", reason="from nonitro cog")
+        self.webhooks[channel.id] = webhook_to_send
+        return webhook_to_send
+
     @commands.Cog.listener()
     async def on_message(self, message):
-        found_webhook = False
         found_emoji = False
         message_list = message.content.split()
         message_to_send_list = []
@@ -20,24 +66,22 @@ class NonNitroEmoji(commands.Cog):
                 return await message.delete()
             if word.startswith(":") and word.endswith(":") and not(message.author.bot):
                 emoji_name = word[1:len(word)-1]
-                for emoji in self.bot.emojis:
-                    if emoji.name.lower() == emoji_name.lower() and emoji.available:
-                        found_emoji = True
-                        message_to_send_list.append(str(emoji))
-                        break
+                emoji = self.get_emoji(emoji_name)
+                if emoji is not None:
+                    found_emoji = True
+                    message_to_send_list.append(str(emoji))
             else:
                 message_to_send_list.append(word)
         if found_emoji:
             message_to_send = " ".join(message_to_send_list)
-            webhooks = await message.channel.webhooks()
-            for webhook in webhooks:
-                if webhook.name == "bot_emoji":
-                    webhook_to_send = webhook
-                    found_webhook = True
-                    break
-            if not(found_webhook):
-                webhook_to_send = await message.channel.create_webhook(name="bot_emoji", reason="from nonitro cog")
-            await webhook_to_send.send(message_to_send, username=message.author.display_name, avatar_url=message.author.avatar_url)
+            webhook_to_send = await self.get_webhook(message.channel)
+            try:
+                await webhook_to_send.send(message_to_send, username=message.author.display_name, avatar_url=message.author.avatar_url)
+            except discord.NotFound:
+                # Deleted before the webhooks update event arrived
+                self.webhooks.pop(message.channel.id, None)
+                webhook_to_send = await self.get_webhook(message.channel)
+                await webhook_to_send.send(message_to_send, username=message.author.display_name, avatar_url=message.author.avatar_url)
             await message.delete()
         
     @commands.command(name="addemoji")
@@ -146,7 +146,7 @@ class ClashRoyaleClans(commands.Cog):
             player_wd_wins = 0
             if member is not None:
                 try:
-                    player_tag = self.tags.getTag(member.id, account)
+                    player_tag = await self.tags.getTag(member.id, account)
                     if player_tag is None:
                         await ctx.send(
                             "You must associate a tag with this member first using "
@@ -401,8 +401,12 @@ class ClashRoyaleClans(commands.Cog):
             absent_names = []  # Tags (URLS?) of people who aren't in Discord
             processed_tags = []
 
+            tags_by_member_id = await self.tags.getAllTagsForUsers(
+                [member.id for member in role.members]
+            )
+
             async for member in AsyncIter(role.members):
-                member_tags = self.tags.quickGetAllTags(member.id)
+                member_tags = tags_by_member_id.get(member.id, [])
                 if len(member_tags) == 0:
                     unknown_members.append(f"{member.name}")
 
@@ -578,7 +582,7 @@ class ClashRoyaleClans(commands.Cog):
 
         is_in_clan = True
         try:
-            player_tag = self.tags.getTag(member.id, account)
+            player_tag = await self.tags.getTag(member.id, account)
             if player_tag is None:
                 return await simple_embed(
                     ctx,
@@ -790,7 +794,7 @@ class ClashRoyaleClans(commands.Cog):
 
         is_clan_member = False
         try:
-            player_tags = self.tags.getAllTags(member.id)
+            player_tags = await self.tags.getAllTags(member.id)
         except AttributeError:
             return await ctx.send("Cannot connect to database. Please notify the devs.")
         clans_joined = []
@@ -972,7 +976,7 @@ class ClashRoyaleClans(commands.Cog):
             return await ctx.send("Command cannot be used in this server")
 
         try:
-            player_tags = self.tags.getAllTags(member.id)
+            player_tags = await self.tags.getAllTags(member.id)
         except AttributeError:
             return await ctx.send("Cannot connect to database. Please notify the devs.")
         clans_joined = []
@@ -1093,7 +1097,7 @@ class ClashRoyaleClans(commands.Cog):
         )
         # If tag is not saved or connection to CR server is not available use current name to determine ign
         try:
-            tag = self.tags.getTag(member.id)
+            tag = await self.tags.getTag(member.id)
         except AttributeError:
             return await ctx.send("Cannot connect to database. Please notify the devs.")
         if tag is None:
@@ -1126,7 +1130,7 @@ class ClashRoyaleClans(commands.Cog):
         pages = list()
         async with ctx.channel.typing():
             try:
-                player_tag = self.tags.getTag(member.id, account)
+                player_tag = await self.tags.getTag(member.id, account)
                 if player_tag is None:
                     return await ctx.send(
                         "You need to first save your profile using ``{}save #tag``".format(
@@ -1294,7 +1298,7 @@ class ClashRoyaleClans(commands.Cog):
             clan_wd_wins = clan_info["requirements"].get("wdwins")
 
             try:
-                player_tag = self.tags.getTag(member.id, account)
+                player_tag = await self.tags.getTag(member.id, account)
                 if player_tag is None:
                     return await simple_embed(
                         ctx,
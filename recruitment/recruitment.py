@@ -321,7 +321,7 @@ class Recruitment(commands.Cog):
                     and player_tag is None
                 ):
                 try:
-                    player_tag = self.tags.getTag(member.id, account)
+                    player_tag = await self.tags.getTag(member.id, account)
                     if player_tag is None:
                         await ctx.send(
                             "You must associate a tag with this member first using "
@@ -460,7 +460,7 @@ class Recruitment(commands.Cog):
         clan_role = self.crclans_cog.get_static_clandata(clankey, "clanrole")
         is_in_clan = True
         try:
-            player_tag = self.tags.getTag(member.id, account)
+            player_tag = await self.tags.getTag(member.id, account)
             if player_tag is None:
                 return await simple_embed(
                     ctx,
@@ -622,7 +622,7 @@ class Recruitment(commands.Cog):
         guild = ctx.guild
         is_clan_member = False
         try:
-            player_tags = self.tags.getAllTags(member.id)
+            player_tags = await self.tags.getAllTags(member.id)
         except AttributeError:
             return await ctx.send("Cannot connect to database. Please notify the devs.")
         clans_joined = []
@@ -783,7 +783,7 @@ class Recruitment(commands.Cog):
         member_roles = set(member.roles)
         # TODO: Refactor into get nickname
         try:
-            tag = self.tags.getTag(member.id)
+            tag = await self.tags.getTag(member.id)
         except AttributeError as e:
             log.exception("Attribute Error in inactive.", exc_info=e)
             await ctx.send("Cannot connect to database. Please notify the devs.")
@@ -836,7 +836,7 @@ class Recruitment(commands.Cog):
                     and player_tag is None
                 ):
                 try:
-                    player_tag = self.tags.getTag(member.id, account)
+                    player_tag = await self.tags.getTag(member.id, account)
                     if player_tag is None:
                         await ctx.send(
                             "You must associate a tag with this member first using "
@@ -999,7 +999,7 @@ class Recruitment(commands.Cog):
                     False,
                 )
         try:
-            player_tag = self.tags.getTag(member.id, account)
+            player_tag = await self.tags.getTag(member.id, account)
             if player_tag is None:
                 await ctx.send(
                     "You must associate a tag with this member first using "
@@ -1244,7 +1244,7 @@ class Recruitment(commands.Cog):
             return await ctx.send("Command cannot be used in this server")
 
         try:
-            player_tags = self.tags.getAllTags(member.id)
+            player_tags = await self.tags.getAllTags(member.id)
         except AttributeError:
             return await ctx.send("Cannot connect to database. Please notify the devs.")
         clans_joined = []
@@ -0,0 +1,131 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+river_types = ['riverRaceDuel', 'boatBattle', 'riverRacePvP']
+
+# Battle times are stored as YYYYmmddHHMMSS so they sort and compare as text
+time_format = '%Y%m%d%H%M%S'
+# The battlelog endpoint only returns this many battles
+battlelog_size = 25
+
+
+def battle_time(battle):
+    """'20210503T101010.000Z' -> '20210503101010'"""
+    return battle['battleTime'].split('.')[0].replace('T', '')
+
+
+def war_week(time):
+    """Date of the monday the war week of a stored battle time started on"""
+    start = datetime.strptime(time, time_format) - timedelta(hours=10)
+    return (start - timedelta(days=start.weekday())).strftime('%Y-%m-%d')
+
+
+class RiverBattleStore:
+    """Local store of river battles collected from player battlelogs
+
+    Battles are deduplicated on player, battleTime and opponent so the same
+    battlelog can be ingested any number of times. For every player the
+    store remembers since when its history is complete, that is since when
+    no battles can have fallen off the 25 battle battlelog unseen.
+
+    The store blocks on disk I/O. It may be used from any thread, but only
+    from one thread at a time.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS battles (
+                player_tag TEXT NOT NULL,
+                battle_time TEXT NOT NULL,
+                opponent_tag TEXT NOT NULL,
+                week TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (player_tag, battle_time, opponent_tag)
+            );
+            CREATE INDEX IF NOT EXISTS idx_week ON battles (week);
+            CREATE TABLE IF NOT EXISTS players (
+                player_tag TEXT PRIMARY KEY,
+                complete_since TEXT NOT NULL,
+                last_polled TEXT NOT NULL
+            );
+            """
+        )
+
+    def close(self):
+        self.db.close()
+
+    def add_battlelog(self, tag, battlelog):
+        """Ingest a player's battlelog as returned by the API"""
+        self.add_battlelogs({tag: battlelog})
+
+    def add_battlelogs(self, battlelogs):
+        """Ingest {tag: battlelog} in a single transaction
+
+        Anything that is not a list of battles, like an API error body, is
+        skipped.
+        """
+        now = datetime.utcnow().strftime(time_format)
+        with self.db:
+            for tag, battlelog in battlelogs.items():
+                if isinstance(battlelog, list):
+                    self._ingest(tag, battlelog, now)
+
+    def _ingest(self, tag, battlelog, now):
+        rows = []
+        for battle in battlelog:
+            if battle['type'] not in river_types:
+                continue
+            time = battle_time(battle)
+            opponent = battle['opponent'][0]['tag'] if battle.get('opponent') else ''
+            rows.append((tag, time, opponent, war_week(time), json.dumps(battle)))
+
+        if len(battlelog) < battlelog_size:
+            # The whole battle history is in the log
+            oldest = '0' * 14
+        else:
+            oldest = min(battle_time(battle) for battle in battlelog)
+
+        self.db.executemany(
+            "INSERT OR IGNORE INTO battles VALUES (?, ?, ?, ?, ?)", rows
+        )
+        row = self.db.execute(
+            "SELECT complete_since, last_polled FROM players WHERE player_tag = ?",
+            (tag,),
+        ).fetchone()
+        if row is None or oldest > row[1]:
+            # First poll, or battles may have been missed since the last one
+            complete_since = oldest
+        else:
+            complete_since = row[0]
+        self.db.execute(
+            "INSERT OR REPLACE INTO players VALUES (?, ?, ?)",
+            (tag, complete_since, now),
+        )
+
+    def is_complete(self, tag, starttime):
+        """Whether every river battle of the player since starttime is stored"""
+        row = self.db.execute(
+            "SELECT complete_since FROM players WHERE player_tag = ?", (tag,)
+        ).fetchone()
+        return row is not None and row[0] <= starttime.strftime(time_format)
+
+    def get_battles(self, tag, starttime, finishtime=None):
+        """River battles of a player between starttime and finishtime, newest first"""
+        query = "SELECT data FROM battles WHERE player_tag = ? AND battle_time > ?"
+        args = [tag, starttime.strftime(time_format)]
+        if finishtime:
+            query += " AND battle_time < ?"
+            args.append(finishtime.strftime(time_format))
+        query += " ORDER BY battle_time DESC"
+        return [json.loads(row[0]) for row in self.db.execute(query, args)]
+
+    def prune(self, weeks=4):
+        """Drop battles from war weeks older than the given amount of weeks"""
+        cutoff = war_week(
+            (datetime.utcnow() - timedelta(weeks=weeks)).strftime(time_format)
+        )
+        with self.db:
+            self.db.execute("DELETE FROM battles WHERE week < ?", (cutoff,))
@@ -5,8 +5,8 @@ from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.utils.chat_formatting import humanize_list, pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu, start_adding_reactions
 from redbot.core.utils.predicates import MessagePredicate
+import aiohttp
 import clashroyale
-import requests
 import random
 import json
 import re
@@ -14,6 +14,9 @@ from datetime import datetime
 from typing import List, Optional
 import datetime as Datetime
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .battlestore import RiverBattleStore
 
 credits = "Bot by Legend Gaming"
 credits_icon = "https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1"
@@ -79,7 +82,18 @@ class RiverRace(commands.Cog):
             self.family_clans = dict(json.load(file))
 
         self.token_task = self.bot.loop.create_task(self.crtoken())
-        
+        # One pooled keep-alive session for every Supercell API request
+        self.session = aiohttp.ClientSession(
+            headers=headers,
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+        )
+        # Limits concurrent battlelog fetches during war audits
+        self.battlelog_semaphore = asyncio.Semaphore(10)
+
+        self.store = RiverBattleStore(cog_data_path(self) / "riverbattles.db")
+        # The store blocks on SQLite, one worker keeps its calls in order
+        self.store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="riverrace")
+        self.collect_task = self.collect_battles.start()
 
     async def crtoken(self):
         # Clash Royale API config
@@ -95,6 +109,18 @@ class RiverRace(commands.Cog):
             self.token_task.cancel()
         if self.clash:
             self.bot.loop.create_task(self.clash.close())
+        if self.collect_task:
+            self.collect_task.cancel()
+        if self.session:
+            self.bot.loop.create_task(self.session.close())
+        self.store_executor.submit(self.store.close)
+        self.store_executor.shutdown(wait=False)
+
+    async def get_json(self, url):
+        async with self.session.get(url) as resp:
+            # Error bodies like {"reason": "accessDenied"} are not data
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
 
     
     async def clean_time(self, time):
@@ -135,36 +161,78 @@ class RiverRace(commands.Cog):
             return True
 
 
+    async def run_store(self, func, *args):
+        """Run a blocking battle store call off the event loop"""
+        return await self.bot.loop.run_in_executor(self.store_executor, func, *args)
+
     async def get_riverBattles(self, tag, finishtime):
-        
-        url = f"https://api.clashroyale.com/v1/players/%23{tag}/battlelog"
 
-        race_data = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))
         starttime = await self.get_monday()
         if finishtime == 0:
             finishtime = False
-        riverBattles = []
-        accuracy = await self.check_accuracy(race_data, starttime)
-        if finishtime:
-            for i in race_data: 
-                if i['type'] in ['riverRaceDuel', 'boatBattle', 'riverRacePvP']:
-                    battletime = await self.clean_time(i["battleTime"])
-                    if finishtime > battletime and starttime < battletime:
-                        riverBattles.append(i)
-        else:
-            for i in race_data: 
-                if i['type'] in ['riverRaceDuel', 'boatBattle', 'riverRacePvP']:
-                    battletime = await self.clean_time(i["battleTime"])
-                    if starttime < battletime:
-                        riverBattles.append(i)
-                    
+        if not await self.run_store(self.store.is_complete, tag, starttime):
+            # Not collected for long enough, top up from the live battlelog
+            url = f"https://api.clashroyale.com/v1/players/%23{tag}/battlelog"
+            try:
+                await self.run_store(self.store.add_battlelog, tag, await self.get_json(url))
+            except aiohttp.ClientError as e:
+                print(f"Could not fetch the battlelog of #{tag}: {e}")
+        accuracy = await self.run_store(self.store.is_complete, tag, starttime)
+        riverBattles = await self.run_store(self.store.get_battles, tag, starttime, finishtime)
         return accuracy, riverBattles
 
+    async def get_all_riverBattles(self, tags, finishtime):
+        """Fetch river battles for many players concurrently
+
+        Returns {tag: (accuracy, riverBattles)}
+        """
+        async def fetch(tag):
+            async with self.battlelog_semaphore:
+                return tag, await self.get_riverBattles(tag, finishtime)
+
+        return dict(await asyncio.gather(*(fetch(tag) for tag in tags)))
+
+    @tasks.loop(minutes=10)
+    async def collect_battles(self):
+        """Poll the battlelogs of all family members into the battle store"""
+        for clan_info in self.family_clans.values():
+            tag = clan_info.get("tag")
+            try:
+                await self.collect_clan_battles(tag)
+            except Exception as e:
+                # One bad clan must not stop the loop
+                print(f"Could not collect battles for #{tag}: {e}")
+        await self.run_store(self.store.prune)
+
+    async def collect_clan_battles(self, tag):
+        members = (await self.get_json(
+            f"https://api.clashroyale.com/v1/clans/%23{tag}/members"))["items"]
+
+        async def collect(member_tag):
+            url = f"https://api.clashroyale.com/v1/players/%23{member_tag}/battlelog"
+            async with self.battlelog_semaphore:
+                return member_tag, await self.get_json(url)
+
+        results = await asyncio.gather(
+            *(collect(m['tag'].strip('#')) for m in members), return_exceptions=True)
+        battlelogs = {}
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Could not collect battles for #{tag}: {result}")
+            else:
+                battlelogs[result[0]] = result[1]
+        # One transaction per clan
+        await self.run_store(self.store.add_battlelogs, battlelogs)
+
+    @collect_battles.before_loop
+    async def before_collect_battles(self):
+        await self.bot.wait_until_red_ready()
+
     async def get_lastriverBattles(self, tag, finishtime):
         
         url = f"https://api.clashroyale.com/v1/players/%23{tag}/battlelog"
 
-        race_data = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))
+        race_data = await self.get_json(url)
         starttime = await self.get_yday()
         if finishtime == 0:
             finishtime = False
@@ -278,7 +346,7 @@ class RiverRace(commands.Cog):
 
         url = f"https://api.clashroyale.com/v1/clans/%23{tag}/currentriverrace"
 
-        race_data = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))["clans"]
+        race_data = (await self.get_json(url))["clans"]
 #        pages = []
         
         for clan in race_data:
@@ -425,7 +493,7 @@ class RiverRace(commands.Cog):
         tag = clan_info.get("tag")
 
         url = f"https://api.clashroyale.com/v1/clans/%23{tag}/currentriverrace"
-        clan = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))["clan"]
+        clan = (await self.get_json(url))["clan"]
 
         pList = clan['participants']
         noboth = []
@@ -442,9 +510,18 @@ class RiverRace(commands.Cog):
                 Tplus.append(p)
 
         url2 = f"https://api.clashroyale.com/v1/clans/%23{tag}"
-        clandata = json.loads(((requests.get(url2, headers = headers)).content).decode("utf-8"))
+        clandata = await self.get_json(url2)
         pList2 = clandata["memberList"]
 
+        # Only current members get a page, fetch all of their battlelogs at once
+        member_tags = {j['tag'] for j in pList2}
+        if 'finishTime' in clan:
+            finishtime = await self.clean_time(clan['finishTime'])
+        else:
+            finishtime = int(0)
+        river_battles = await self.get_all_riverBattles(
+            [p['tag'].strip('#') for p in pList if p['tag'] in member_tags], finishtime)
+
         clanEmbed = discord.Embed(title = f"{clandata['name']} ({clandata['tag']})",
                                 description = f"{clandata['description']}",
                                 color = 0xD4AF37)
@@ -477,10 +554,7 @@ class RiverRace(commands.Cog):
                 embed = discord.Embed(description = f"**Trophies:** {tab} **Donations:** \n<:crtrophy:685013098801004544> {trophy}{tab*2}<:cards:685013098670850078> {donation}", timestamp = lastseen, color = 0xff0000)
                 embed.set_author(name= f"{i['name']} ({i['tag']})", icon_url= f"https://cdn.discordapp.com/emojis/{self.emoji(level)}.png?v=1")
                 embed.set_footer(text="Last Seen")
-                if 'finishTime' in clan:
-                    accuracy, battles = await self.get_riverBattles(i['tag'].strip('#'), await self.clean_time(clan['finishTime']))
-                else:
-                    accuracy, battles = await self.get_riverBattles(i['tag'].strip('#'), int(0))
+                accuracy, battles = river_battles[i['tag'].strip('#')]
                 dBB, aBB, pvp, duel = await self.seperate(battles)
                 embed.add_field(name= "<:cw2:751746305830682644> __River Stats__ <:cw2:751746305830682644>",
                                 value= f"**Fame & Repair:{tab}Total:**\n<:fame:685013098540564502> {i['fame']} \u200B <:repair:750646558483284020> {i['repairPoints']}{tab*3}<:famehammer3:750978996740685835>{i['fame']+i['repairPoints']}", inline=False)
@@ -539,11 +613,8 @@ class RiverRace(commands.Cog):
                 embed = discord.Embed(description = f"**Trophies:** {tab} **Donations:** \n<:crtrophy:685013098801004544> {trophy}{tab*2}<:cards:685013098670850078> {donation}", timestamp =lastseen, color = 0xff4d00)
                 embed.set_author(name= f"{i['name']} ({i['tag']})", icon_url= f"https://cdn.discordapp.com/emojis/{self.emoji(level)}.png?v=1")
                 embed.set_footer(text="Last Seen")
-                if 'finishTime' in clan:
-                    accuracy, battles = await self.get_riverBattles(i['tag'].strip('#'), await self.clean_time(clan['finishTime']))
-                else:
-                    accuracy, battles = await self.get_riverBattles(i['tag'].strip('#'), int(0))
-                    dBB, aBB, pvp, duel = await self.seperate(battles)
+                accuracy, battles = river_battles[i['tag'].strip('#')]
+                dBB, aBB, pvp, duel = await self.seperate(battles)
                 embed.add_field(name= "<:cw2:751746305830682644> __River Stats__ <:cw2:751746305830682644>",
                                 value= f"**Fame & Repair:{tab}Total:**\n<:fame:685013098540564502> {i['fame']} \u200B <:repair:750646558483284020> {i['repairPoints']}{tab*2}<:famehammer3:750978996740685835>{i['fame']+i['repairPoints']}", inline=False)
                 if accuracy == True: 
@@ -601,10 +672,7 @@ class RiverRace(commands.Cog):
                 embed = discord.Embed(description = f"**Trophies:** {tab} **Donations:** \n<:crtrophy:685013098801004544> {trophy}{tab*2}<:cards:685013098670850078> {donation}", timestamp =lastseen, color=0x12b525)
                 embed.set_author(name= f"{i['name']} ({i['tag']})", icon_url= f"https://cdn.discordapp.com/emojis/{self.emoji(level)}.png?v=1")
                 embed.set_footer(text="Last Seen")
-                if 'finishTime' in clan:
-                    accuracy, battles = await self.get_riverBattles(i['tag'].strip('#'), await self.clean_time(clan['finishTime']))
-                else:
-                    accuracy, battles = await self.get_riverBattles(i['tag'].strip('#'), int(0))
+                accuracy, battles = river_battles[i['tag'].strip('#')]
                 dBB, aBB, pvp, duel = await self.seperate(battles)
                 embed.add_field(name= "<:cw2:751746305830682644> __River Stats__ <:cw2:751746305830682644>",
                                 value= f"**Fame & Repair:{tab}Total:**\n<:fame:685013098540564502> {i['fame']} \u200B <:repair:750646558483284020> {i['repairPoints']}{tab*2}<:famehammer3:750978996740685835>{i['fame']+i['repairPoints']}", inline=False)
@@ -663,7 +731,7 @@ class RiverRace(commands.Cog):
 
         if member is not None:
             try:
-                player_tag = self.tags.getTag(member.id, account)
+                player_tag = await self.tags.getTag(member.id, account)
                 ptag = player_tag
                 if player_tag is None:
                     await ctx.send(
@@ -696,7 +764,7 @@ class RiverRace(commands.Cog):
                 )   
 
         url = f"https://api.clashroyale.com/v1/clans/%23{tag}/currentriverrace"
-        clan = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))["clan"]
+        clan = (await self.get_json(url))["clan"]
 
         pList = clan['participants']
         noboth = []
@@ -712,7 +780,7 @@ class RiverRace(commands.Cog):
                 Tplus.append(p)
 
         url2 = f"https://api.clashroyale.com/v1/clans/%23{tag}"
-        clandata = json.loads(((requests.get(url2, headers = headers)).content).decode("utf-8"))
+        clandata = await self.get_json(url2)
         pList2 = clandata["memberList"] 
 
         for i in pList:
@@ -788,7 +856,7 @@ class RiverRace(commands.Cog):
 
         if member is not None:
             try:
-                player_tag = self.tags.getTag(member.id, account)
+                player_tag = await self.tags.getTag(member.id, account)
                 ptag = player_tag
                 if player_tag is None:
                     await ctx.send(
@@ -821,7 +889,7 @@ class RiverRace(commands.Cog):
                 )   
 
         url = f"https://api.clashroyale.com/v1/clans/%23{tag}/currentriverrace"
-        clan = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))["clan"]
+        clan = (await self.get_json(url))["clan"]
 
         pList = clan['participants']
         noboth = []
@@ -837,7 +905,7 @@ class RiverRace(commands.Cog):
                 Tplus.append(p)
 
         url2 = f"https://api.clashroyale.com/v1/clans/%23{tag}"
-        clandata = json.loads(((requests.get(url2, headers = headers)).content).decode("utf-8"))
+        clandata = await self.get_json(url2)
         pList2 = clandata["memberList"] 
 
         for i in pList:
@@ -933,7 +1001,7 @@ class RiverRace(commands.Cog):
         tag = clan_info.get("tag") 
 
         url = f"https://api.clashroyale.com/v1/clans/%23{tag}/currentriverrace"
-        plist = json.loads(((requests.get(url, headers = headers)).content).decode("utf-8"))["clan"]['participants']
+        plist = (await self.get_json(url))["clan"]['participants']
         raffle = {}
         details = {}
         if 0 > number > 25:
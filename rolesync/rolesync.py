@@ -1,15 +1,34 @@
 from discord import member
 from redbot.core import commands, Config, checks
+import asyncio
+import time
 import discord
 
 default_global = {
     'logchannel': None,
     'enabledguilds': [],
+    # guild id -> {'channel': channel id, 'last_member': id of the last synced member}
+    'forcesync_jobs': {},
 
 }
 default_user = {
     'roles' : []
 }
+# Role lists live in one custom group so a batch of them is a single write
+roles_group = 'USER_ROLES'
+default_user_roles = {
+    # None until first written, the per user 'roles' from before are used until then
+    'roles': None
+}
+# Seconds role changes are collected for before they are written to Config
+write_delay = 10
+# Seconds after which an edit of our own that never showed up is forgotten
+ledger_ttl = 60
+# Members synced between two forcesync checkpoints
+forcesync_chunk = 100
+# Members of a forcesync chunk synced at the same time
+forcesync_workers = 5
+
 """
 - Listener
 - Logging
@@ -29,6 +48,69 @@ class RoleSync(commands.Cog):
         self.config = Config.get_conf(self, 8818154, force_registration=True)
         self.config.register_global(**default_global)
         self.config.register_user(**default_user)
+        self.config.init_custom(roles_group, 1)
+        self.config.register_custom(roles_group, **default_user_roles)
+        # guild id -> {role name: role}, dropped whenever the guild's roles change
+        self.role_index = {}
+        # (guild id, member id) -> (role ids the edit results in, time of the edit)
+        self.own_edits = {}
+        # user id -> role names waiting to be written to Config
+        self.pending_roles = {}
+        # user id -> role names currently being written
+        self.writing_roles = {}
+        self.write_task = None
+        # guild id -> running forcesync task / (synced members, total members)
+        self.forcesync_tasks = {}
+        self.forcesync_progress = {}
+        self.resume_task = self.bot.loop.create_task(self.resume_forcesyncs())
+
+    def cog_unload(self):
+        self.resume_task.cancel()
+        for task in self.forcesync_tasks.values():
+            task.cancel()
+        if self.write_task and not self.write_task.done():
+            # A write in progress is shielded and finishes on its own
+            self.write_task.cancel()
+        if self.pending_roles:
+            self.bot.loop.create_task(self.write_roles())
+
+    async def get_user_roles(self, user):
+        if user.id in self.pending_roles:
+            return list(self.pending_roles[user.id])
+        if user.id in self.writing_roles:
+            return list(self.writing_roles[user.id])
+        roles = await self.config.custom(roles_group, user.id).roles()
+        if roles is None:
+            roles = await self.config.user(user).roles()
+        return roles
+
+    def set_user_roles(self, user, roles):
+        """Remember the roles of a user, written to Config by the next write"""
+        self.pending_roles[user.id] = list(roles)
+        if self.write_task is None or self.write_task.done():
+            self.write_task = self.bot.loop.create_task(self.write_roles_later())
+
+    async def write_roles_later(self):
+        # Roles set while a write is in progress go out with the next one
+        while self.pending_roles:
+            await asyncio.sleep(write_delay)
+            await asyncio.shield(self.write_roles())
+
+    async def write_roles(self, pending=None):
+        """Write role lists to Config in one go, the pending ones by default"""
+        if pending is None:
+            pending, self.pending_roles = self.pending_roles, {}
+        if not pending:
+            return
+        self.writing_roles.update(pending)
+        try:
+            async with self.config.custom(roles_group).all() as user_roles:
+                for user_id, roles in pending.items():
+                    user_roles[str(user_id)] = {'roles': roles}
+        finally:
+            for user_id, roles in pending.items():
+                if self.writing_roles.get(user_id) is roles:
+                    del self.writing_roles[user_id]
 
     async def log(self, message: str):
         channelid = await self.config.logchannel()
@@ -39,12 +121,35 @@ class RoleSync(commands.Cog):
         await channel.send(message)
         
 
+    def get_role_index(self, guild: discord.Guild):
+        index = self.role_index.get(guild.id)
+        if index is None:
+            index = {}
+            # Like the old linear search, the lowest role wins on duplicate names
+            for role in reversed(guild.roles):
+                index[role.name] = role
+            self.role_index[guild.id] = index
+        return index
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self.role_index.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.role_index.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.role_index.pop(role.guild.id, None)
+
     async def get_role(self, guild: discord.Guild, role_name: str):
-        for role in guild.roles:
-            if role.name == role_name:
-                return role
+        role = self.get_role_index(guild).get(role_name)
+        if role is not None:
+            return role
         try:
             role = await guild.create_role(name=role_name)
+            self.get_role_index(guild)[role_name] = role
             await self.log(f"The server {guild.name} did not have the role {role_name}. The role was created and assigned.")
         except discord.Forbidden:
             await self.log(f"The server {guild.name} did not have the role {role_name}. I could not create the role. ")
@@ -58,25 +163,41 @@ class RoleSync(commands.Cog):
         if user.guild.id not in guilds:
             return
         if config is None:
-            config = await self.config.user(user).roles()
+            config = await self.get_user_roles(user)
         guild: discord.guild = user.guild
         croles = user.roles
-        extroles = [await self.get_role(guild, x) for x in config if await self.get_role(guild, x) not in croles]
-        for role in extroles:
+        top_role = guild.me.top_role
+        extroles = []
+        for name in config:
+            role = await self.get_role(guild, name)
             if role is None:
-                await self.log("The user {user.mention} needs the role above which could't be created.}")
-            try:
-                await user.add_roles(role, reason='Rolesync')
-            except discord.Forbidden:
-                await self.log(f"The role {role.name} from the server {user.guild.name} could not be added to the user {user.mention} because the role is above me or I don't have the manage roles permission. Please do this manually!")
-        if noremove:
+                await self.log(f"The user {user.mention} needs the role {name} which could't be created.")
+            elif role not in croles and role not in extroles and not role.managed and not role.is_default():
+                extroles.append(role)
+        rmroles = []
+        if not noremove:
+            rmroles = [x for x in croles if x.name not in config and not x.is_default() and not x.managed]
+        # Roles above the bot would fail the whole edit, leave them out
+        for role in [x for x in extroles if x >= top_role]:
+            extroles.remove(role)
+            await self.log(f"The role {role.name} from the server {user.guild.name} could not be added to the user {user.mention} because the role is above me or I don't have the manage roles permission. Please do this manually!")
+        for role in [x for x in rmroles if x >= top_role]:
+            rmroles.remove(role)
+            await self.log(f"The role {role.name} from the server {user.guild.name} could not be removed from the user {user.mention} because the role is above me or I don't have the manage roles permission. Please do this manually!")
+        if not extroles and not rmroles:
             return
-        rmroles = [x for x in croles if x.name not in config]
-        for role in rmroles:
-            try:
-                await user.remove_roles(role, reason='Rolesync')
-            except discord.Forbidden:
-                await self.log(f"The role {role.name} from the server {user.guild.name} could not be removed from the user {user.mention} because the role is above me or I don't have the manage roles permission. Please do this manually!")
+        roles = [x for x in croles if x not in rmroles and not x.is_default()] + extroles
+        # Lets on_member_update recognise the update caused by this edit
+        self.own_edits[(guild.id, user.id)] = (
+            frozenset(x.id for x in roles) | {guild.default_role.id}, time.monotonic())
+        try:
+            await user.edit(roles=roles, reason='Rolesync')
+        except discord.Forbidden:
+            self.own_edits.pop((guild.id, user.id), None)
+            await self.log(f"The roles of the user {user.mention} in the server {user.guild.name} could not be synced because I don't have the manage roles permission. Please do this manually!")
+        except discord.HTTPException as e:
+            self.own_edits.pop((guild.id, user.id), None)
+            await self.log(f"The roles of the user {user.mention} in the server {user.guild.name} could not be synced: {e}")
         # print("added:", extroles)
         # print("removed:", rmroles)
 
@@ -89,28 +210,29 @@ class RoleSync(commands.Cog):
     
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
+        # Nickname, avatar, ... changes
+        if before.roles == after.roles:
+            return
         guilds = await self.config.enabledguilds()
         if before.guild.id not in guilds:
             return
-        search = True
-        async for entry in before.guild.audit_logs(limit=20, action=discord.AuditLogAction.member_role_update):
-            if entry.after == after:
-                break
-            if entry.target.id == before.id and entry.reason == "Rolesync" and entry.after == after:
-                search = False
-                break
-
-        if search == False:
+        now = time.monotonic()
+        for key in [k for k, (_, t) in self.own_edits.items() if now - t > ledger_ttl]:
+            del self.own_edits[key]
+        own_edit = self.own_edits.get((after.guild.id, after.id))
+        if own_edit is not None and own_edit[0] == frozenset(x.id for x in after.roles):
+            # The update is the result of our own sync
+            del self.own_edits[(after.guild.id, after.id)]
             return
 
         nroles = [x.name for x in after.roles]
-        await self.config.user(after).roles.set(nroles)
+        self.set_user_roles(after, nroles)
         for guildid in guilds:
             guild: discord.Guild = self.bot.get_guild(guildid)
             member = guild.get_member(after.id)
             # print(member)
             if member is not None:
-                await self.syncuser(member)
+                await self.syncuser(member, config=nroles)
 
 
     @commands.group(aliases=['rolesyncset', 'setrs', 'rsset'])
@@ -148,22 +270,91 @@ class RoleSync(commands.Cog):
         await ctx.send("Done!")
     
     
+    async def resume_forcesyncs(self):
+        await self.bot.wait_until_red_ready()
+        jobs = await self.config.forcesync_jobs()
+        for guildid in jobs:
+            guild = self.bot.get_guild(int(guildid))
+            if guild is not None:
+                self.start_forcesync(guild)
+
+    def start_forcesync(self, guild: discord.Guild):
+        task = self.bot.loop.create_task(self.run_forcesync(guild))
+        self.forcesync_tasks[guild.id] = task
+        task.add_done_callback(lambda _: self.forcesync_tasks.pop(guild.id, None))
+
+    async def forcesync_member(self, semaphore, member, roles, guilds):
+        async with semaphore:
+            for guildid in guilds:
+                guild: discord.Guild = self.bot.get_guild(guildid)
+                if guild is None:
+                    continue
+                await self.syncuser(guild.get_member(member.id), config=roles, noremove=True)
+
+    async def run_forcesync(self, guild: discord.Guild):
+        """Sync the roles of every member of the guild, resuming from the checkpoint"""
+        job = (await self.config.forcesync_jobs()).get(str(guild.id), {})
+        last_member = job.get('last_member') or 0
+        members = sorted(guild.members, key=lambda x: x.id)
+        todo = [x for x in members if x.id > last_member]
+        self.forcesync_progress[guild.id] = (len(members) - len(todo), len(members))
+        semaphore = asyncio.Semaphore(forcesync_workers)
+        try:
+            for start in range(0, len(todo), forcesync_chunk):
+                chunk = todo[start:start + forcesync_chunk]
+                chunk_roles = {}
+                for chunk_member in chunk:
+                    roles = await self.get_user_roles(chunk_member)
+                    roles.extend(x.name for x in chunk_member.roles if x.name not in roles)
+                    chunk_roles[chunk_member.id] = roles
+                    self.pending_roles.pop(chunk_member.id, None)
+                await self.write_roles(chunk_roles)
+                guilds = await self.config.enabledguilds()
+                await asyncio.gather(*(
+                    self.forcesync_member(semaphore, chunk_member, chunk_roles[chunk_member.id], guilds)
+                    for chunk_member in chunk))
+                async with self.config.forcesync_jobs() as jobs:
+                    jobs[str(guild.id)]['last_member'] = chunk[-1].id
+                done, total = self.forcesync_progress[guild.id]
+                self.forcesync_progress[guild.id] = (done + len(chunk), total)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.forcesync_progress.pop(guild.id, None)
+            await self.log(f"Forcesync of the server {guild.name} stopped: {e}. Use `!setrolesync forcesync` to resume it.")
+            return
+        async with self.config.forcesync_jobs() as jobs:
+            channelid = jobs.pop(str(guild.id), {}).get('channel')
+        self.forcesync_progress.pop(guild.id, None)
+        channel = self.bot.get_channel(channelid)
+        if channel is not None:
+            await channel.send(f"Forcesync of {guild.name} is done!")
+
     @setrolesync.command()
     async def forcesync(self, ctx):
-        """Force sync this server's roles"""
-        await ctx.send("This will take awhile... (Please don't run multiple forcesync's at the same time. Wait for for me to say Done)")
-        # await ctx.send("Note that other role ")
-        async with ctx.typing():
-            for member in ctx.guild.members:
-                roles = await self.config.user(member).roles()
-                croles = member.roles
-                roles.extend(x.name for x in croles if x.name not in roles)
-                await self.config.user(member).roles.set(roles)
-                guilds = await self.config.enabledguilds()
-                for guildid in guilds:
-                    guild: discord.Guild = self.bot.get_guild(guildid)
-                    membern = guild.get_member(member.id)
-                    await self.syncuser(membern, config=roles, noremove=True)
-        await ctx.send("Done!")
-        
+        """Force sync this server's roles
+
+        Runs in the background and resumes after a restart.
+        """
+        if ctx.guild.id in self.forcesync_tasks:
+            return await ctx.send("A forcesync of this server is already running. Use `!setrolesync forcesyncstatus` to see its progress.")
+        async with self.config.forcesync_jobs() as jobs:
+            job = jobs.setdefault(str(ctx.guild.id), {'last_member': None})
+            job['channel'] = ctx.channel.id
+            resumed = job['last_member'] is not None
+        self.start_forcesync(ctx.guild)
+        if resumed:
+            await ctx.send("Resuming the unfinished forcesync of this server. I will say when it is done.")
+        else:
+            await ctx.send("This will take awhile... I will say when it is done.")
+
+    @setrolesync.command()
+    async def forcesyncstatus(self, ctx):
+        """Show the progress of this server's forcesync"""
+        progress = self.forcesync_progress.get(ctx.guild.id)
+        if progress is None:
+            return await ctx.send("No forcesync of this server is running.")
+        done, total = progress
+        await ctx.send(f"Synced {done} of {total} members.")
+
         # ext: perms
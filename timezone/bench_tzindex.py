@@ -0,0 +1,66 @@
+"""Benchmark of TimezoneIndex against the fuzzy search it replaced.
+
+Needs pytz and fuzzywuzzy but neither Red nor discord:
+
+    python timezone/bench_tzindex.py
+"""
+import time
+
+import pytz
+from fuzzywuzzy import fuzz, process
+
+from tzindex import TimezoneIndex
+
+QUERIES = [
+    "America/New_York",
+    "new york",
+    "London",
+    "kolkata",
+    "Europe",
+    "america/los",
+    "Sao Paulo",
+    "tokyo",
+    "Australia/Sydney",
+    "xyzzy",
+]
+RUNS = 5
+
+
+def fuzzy_search(tz):
+    fuzzy_results = process.extract(tz.replace(" ", "_"), pytz.common_timezones, limit=500, scorer=fuzz.partial_ratio)
+    return [x for x in fuzzy_results if x[1] > 98]
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        for query in QUERIES:
+            func(query)
+    return (time.perf_counter() - start) / (RUNS * len(QUERIES))
+
+
+def main():
+    start = time.perf_counter()
+    index = TimezoneIndex(pytz.common_timezones)
+    build = time.perf_counter() - start
+
+    for query in QUERIES:
+        old = {tz for tz, _ in fuzzy_search(query)}
+        new = {tz for tz, _ in index.search(query)}
+        assert old == new, query
+
+    fuzzy = timed(fuzzy_search)
+    index = TimezoneIndex(pytz.common_timezones)
+    cold = timed(lambda query: index.search.__wrapped__(index, query))
+    for query in QUERIES:
+        index.search(query)
+    memoized = timed(index.search)
+
+    print("build: {:.3f}ms for {} timezones".format(build * 1000, len(pytz.common_timezones)))
+    print("fuzzy: {:.3f}ms per query".format(fuzzy * 1000))
+    print("index, cold: {:.3f}ms per query".format(cold * 1000))
+    print("index, memoized: {:.3f}us per query".format(memoized * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 import discord
 import pytz
 from datetime import datetime
-from fuzzywuzzy import fuzz, process
 from typing import Optional, Literal
 from redbot.core import Config, commands
 from redbot.core.utils.chat_formatting import pagify
 from redbot.core.utils.menus import close_menu, menu, DEFAULT_CONTROLS
 
+from .tzindex import TimezoneIndex
+
 
 __version__ = "2.1.0"
 
 
+timezone_index = TimezoneIndex(pytz.common_timezones)
+
+
 class Timezone(commands.Cog):
     """Gets times across the world..."""
     def __init__(self, bot):
@@ -33,9 +37,7 @@ class Timezone(commands.Cog):
         return usertime, tz
 
     def fuzzy_timezone_search(self, tz: str):
-        fuzzy_results = process.extract(tz.replace(" ", "_"), pytz.common_timezones, limit=500, scorer=fuzz.partial_ratio)
-        matches = [x for x in fuzzy_results if x[1] > 98] 
-        return matches
+        return list(timezone_index.search(tz))
 
     async def format_results(self, ctx, tz):
         if not tz:
@@ -0,0 +1,39 @@
+import re
+from functools import lru_cache
+from fuzzywuzzy import fuzz, process
+
+
+def normalize(name: str) -> str:
+    """Lowercase with everything but letters and digits as single spaces, like fuzzywuzzy's full_process"""
+    return " ".join(re.sub(r"[^0-9a-z]", " ", name.lower()).split())
+
+
+class TimezoneIndex:
+    """Lookups over pytz.common_timezones, built once."""
+
+    def __init__(self, timezones):
+        self.timezones = list(timezones)
+        self.normalized = [(normalize(tz), tz) for tz in self.timezones]
+        self.exact = {}
+        self.cities = {}
+        for key, tz in self.normalized:
+            self.exact.setdefault(key, tz)
+            self.cities.setdefault(normalize(tz.split("/")[-1]), []).append(tz)
+
+    @lru_cache(maxsize=1024)
+    def search(self, query: str):
+        """Matching timezones as (name, score) tuples, most specific lookup first"""
+        key = normalize(query)
+        if not key:
+            return ()
+        if key in self.exact:
+            return ((self.exact[key], 100),)
+        if key in self.cities:
+            return tuple((tz, 100) for tz in self.cities[key])
+        # Same results the fuzzy partial_ratio > 98 search gave for the query
+        # being part of the name, including prefixes
+        found = tuple((tz, 100) for name, tz in self.normalized if key in name)
+        if found:
+            return found
+        fuzzy_results = process.extract(query.replace(" ", "_"), self.timezones, limit=500, scorer=fuzz.partial_ratio)
+        return tuple(x for x in fuzzy_results if x[1] > 98)
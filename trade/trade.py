@@ -50,6 +50,68 @@ member_settings = {
 credits="Bot by Legend Gaming"
 credits_url = "https://cdn.discordapp.com/emojis/709796075581735012.gif?v=1"
 
+
+class TradeIndex:
+    """Members of a guild by the cards they give / want and the tokens they hold"""
+
+    def __init__(self, members=None):
+        self.givers = {}
+        self.wanters = {}
+        self.tokens = {rarity: set() for rarity in token_type}
+        for member_id, data in (members or {}).items():
+            for cards in data.get('give', {}).values():
+                for card in cards:
+                    self.givers.setdefault(card, set()).add(member_id)
+            for cards in data.get('want', {}).values():
+                for card in cards:
+                    self.wanters.setdefault(card, set()).add(member_id)
+            for rarity, has_token in data.get('token', {}).items():
+                if has_token:
+                    self.tokens[rarity].add(member_id)
+
+    def __bool__(self):
+        return bool(self.givers or self.wanters or any(self.tokens.values()))
+
+    @staticmethod
+    def _add(index, card, member_id):
+        index.setdefault(card, set()).add(member_id)
+
+    @staticmethod
+    def _remove(index, card, member_id):
+        members = index.get(card)
+        if members is not None:
+            members.discard(member_id)
+            if not members:
+                del index[card]
+
+    def add_give(self, card, member_id):
+        self._add(self.givers, card, member_id)
+
+    def remove_give(self, card, member_id):
+        self._remove(self.givers, card, member_id)
+
+    def add_want(self, card, member_id):
+        self._add(self.wanters, card, member_id)
+
+    def remove_want(self, card, member_id):
+        self._remove(self.wanters, card, member_id)
+
+    def set_token(self, rarity, member_id, has_token):
+        if has_token:
+            self.tokens[rarity].add(member_id)
+        else:
+            self.tokens[rarity].discard(member_id)
+
+    def search(self, card, rarity):
+        """{member id: [gives card, wants card, has token]} of the members trading the card"""
+        givers = self.givers.get(card, set())
+        wanters = self.wanters.get(card, set())
+        tokens = self.tokens[rarity]
+        return {
+            player: [player in givers, player in wanters, player in tokens]
+            for player in givers | wanters
+        }
+
 class Trade(commands.Cog):
     """Clash Royale Trading Helper"""
 
@@ -67,6 +129,8 @@ class Trade(commands.Cog):
 
         self.database = Config.get_conf(self, identifier=7894561230, force_registration=True)
         self.database.register_member(**member_settings)
+        # guild id -> TradeIndex, built from Config on the first use
+        self.indexes = {}
         
         # init card data
         self.cards_abbrev = {}
@@ -75,13 +139,21 @@ class Trade(commands.Cog):
             for value in v:
                 self.cards_abbrev[value] = k
             self.cards_abbrev[k] = k
-            
+
+        self.card_rarity = {}
+        for card in self.card_stats:
+            self.card_rarity.setdefault(card["name"], card["rarity"])
+
+    async def getIndex(self, guild_id):
+        index = self.indexes.get(guild_id)
+        if index is None:
+            members = await self.database.all_members(discord.Object(id=guild_id))
+            index = self.indexes.setdefault(guild_id, TradeIndex(members))
+        return index
+
     async def cardToRarity(self, name):
         """Card name to rarity."""
-        for card in self.card_stats:
-            if name == card["name"]:
-                return card["rarity"]
-        return None
+        return self.card_rarity.get(name)
         
     async def saveCardWant(self, member, card):
         rarity = await self.cardToRarity(card)
@@ -90,6 +162,7 @@ class Trade(commands.Cog):
         async with self.database.member(member).want() as want:
             if card not in want[rarity]:
                 want[rarity].append(card)
+        (await self.getIndex(member.guild.id)).add_want(card, member.id)
               
     async def removeCardWant(self, member, card):
         rarity = await self.cardToRarity(card)
@@ -98,6 +171,7 @@ class Trade(commands.Cog):
         async with self.database.member(member).want() as want:
             if card in want[rarity]:
                 want[rarity].remove(card)
+        (await self.getIndex(member.guild.id)).remove_want(card, member.id)
                         
     async def saveCardGive(self, member, card):
         rarity = await self.cardToRarity(card)
@@ -106,6 +180,7 @@ class Trade(commands.Cog):
         async with self.database.member(member).give() as give:
             if card not in give[rarity]:
                 give[rarity].append(card)
+        (await self.getIndex(member.guild.id)).add_give(card, member.id)
    
     async def removeCardGive(self, member, card):
         rarity = await self.cardToRarity(card)
@@ -113,6 +188,7 @@ class Trade(commands.Cog):
         
         async with self.database.member(member).give() as give:
             give[rarity].remove(card)
+        (await self.getIndex(member.guild.id)).remove_give(card, member.id)
             
     async def cardInWant(self, member, card):
         rarity = await self.cardToRarity(card)
@@ -137,40 +213,22 @@ class Trade(commands.Cog):
     async def saveToken(self, member, token_name):
         async with self.database.member(member).token() as token:
             token[token_name] = True
+        (await self.getIndex(member.guild.id)).set_token(token_name, member.id, True)
         
     async def removeToken(self, member, token_type):
         async with self.database.member(member).token() as token:
-            token[token_type] = False        
+            token[token_type] = False
+        (await self.getIndex(member.guild.id)).set_token(token_type, member.id, False)
     
     async def searchTrades(self, card, guild):
         rarity = await self.cardToRarity(card)
         rarity = rarity.lower() 
         
-        trades = {}
-        members = await self.database.all_members()
-   
-        
-        if members:
-            if guild in members:
-                members = members[guild]
-                for player in members:
-                    player_data = members[player]
-                    trades[player] = [False, False, False]
-                    if card in player_data['give'][rarity]:
-                        trades[player][0] = True
-                    if card in player_data['want'][rarity]:
-                        trades[player][1] = True
-                    if player_data['token'][rarity]:
-                        trades[player][2] = True
-    
-                return trades
-
-            else:
-                print("Hmm. No guild. That was not supposed to happen! ")
-                return 0                
-
-        else:
+        index = await self.getIndex(guild)
+        if not index:
             return 0
+
+        return index.search(card, rarity)
         
         
     async def sortTrades(self, server, author, trades):
@@ -434,5 +492,6 @@ class Trade(commands.Cog):
         """ Delete all data of all members"""
         
         await self.database.clear_all_members()
+        self.indexes = {}
         await ctx.send("Deleted.")
         
@@ -3,4 +3,5 @@ from .welcome import Welcome
 async def setup(bot):
     cog = Welcome(bot=bot)
     await cog.crtoken()
+    await cog.evict_states()
     bot.add_cog(cog)
\ No newline at end of file
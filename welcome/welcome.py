@@ -1,8 +1,11 @@
 import asyncio
 from copy import deepcopy
+from datetime import datetime
 import json
 import logging
+import os
 from random import choice as rand_choice
+import time
 
 import clashroyale
 import discord
@@ -13,6 +16,8 @@ from redbot.core.data_manager import bundled_data_path, cog_data_path
 legend_guild_id = 374596069989810176
 global_chat_id = 374596069989810178
 gate_id = 374597911436328971
+# Seconds a new member has to go through the menus
+menu_timeout = 1200
 
 
 credits = "Bot by Legend Gaming"
@@ -484,14 +489,19 @@ class Welcome(commands.Cog):
         self.tags = self.bot.get_cog('ClashRoyaleTools').tags
         self.constants = self.bot.get_cog('ClashRoyaleTools').constants
         self.clans = self.bot.get_cog('ClashRoyaleClans')
+        # user id -> {"history", "data", "message_id", "started"}, mirrored in Config
         self.user_history = {}
         self.joined = []
         self.config = Config.get_conf(self, identifier=251098479837495659987)
-        default_global = {}
+        default_global = {
+            # Seconds ClashRoyaleClans2's clan data may be old for the clan menu
+            "clan_snapshot_max_age": 120,
+        }
         self.config.register_global(**default_global)
+        self.config.register_user(menu_state={})
         self.claninfo_path = str(cog_data_path(self.clans) / "clans.json")
-        with open(self.claninfo_path) as file:
-            self.family_clans = dict(json.load(file))
+        self.claninfo_mtime = None
+        self.load_family_clans()
         self.welcome_path = str(bundled_data_path(self.clans) / "welcome_messages.json")
         with open(self.welcome_path) as file:
             self.welcome = dict(json.load(file))
@@ -506,6 +516,55 @@ class Welcome(commands.Cog):
                                                   url="https://proxy.royaleapi.dev/v1")
 
 
+    def load_family_clans(self):
+        """(Re)load clans.json and the clan tag index if the file changed"""
+        mtime = os.stat(self.claninfo_path).st_mtime
+        if mtime == self.claninfo_mtime:
+            return
+        with open(self.claninfo_path) as file:
+            self.family_clans = dict(json.load(file))
+        # clan tag -> clan data, the first clan wins like the old linear search
+        self.family_clans_by_tag = {}
+        for data in self.family_clans.values():
+            self.family_clans_by_tag.setdefault(data.get("tag"), data)
+        self.claninfo_mtime = mtime
+
+    def new_state(self, user, history=None):
+        state = {"history": history or ["main"], "data": {}, "message_id": None, "started": time.time()}
+        self.user_history[user.id] = state
+        return state
+
+    async def get_state(self, user):
+        """Menu state of the user, None when there is none or it expired"""
+        state = self.user_history.get(user.id)
+        if state is None:
+            state = await self.config.user(user).menu_state()
+            if not state:
+                return None
+            self.user_history[user.id] = state
+        if time.time() - state.get("started", 0) > menu_timeout:
+            await self.clear_state(user)
+            return None
+        return state
+
+    async def save_state(self, user):
+        state = self.user_history.get(user.id)
+        if state is not None:
+            await self.config.user(user).menu_state.set(state)
+
+    async def clear_state(self, user):
+        self.user_history.pop(user.id, None)
+        await self.config.user(user).menu_state.clear()
+
+    async def evict_states(self):
+        """Drop the saved menu states older than the onboarding window"""
+        now = time.time()
+        for user_id, data in (await self.config.all_users()).items():
+            state = data.get("menu_state")
+            if state and now - state.get("started", 0) > menu_timeout:
+                await self.config.user_from_id(user_id).menu_state.clear()
+                self.user_history.pop(user_id, None)
+
     async def emoji(self, name):
         """Emoji by name."""
         for emoji in self.bot.emojis:
@@ -518,12 +577,12 @@ class Welcome(commands.Cog):
         if channel is None:
             channel = await user.create_dm()
 
-        async for message in channel.history(limit=10):
-            if message.author.id == self.bot.user.id:
-                try:
-                    await message.delete()
-                except discord.NotFound:
-                    pass
+        state = self.user_history.get(user.id)
+        if state and state.get("message_id"):
+            try:
+                await channel.get_partial_message(state["message_id"]).delete()
+            except discord.HTTPException:
+                pass
 
         retry = 0
         try:
@@ -617,6 +676,10 @@ class Welcome(commands.Cog):
 
         new_message = await self.change_message(user, embed, reactions=reactions)
 
+        if user.id in self.user_history and isinstance(new_message, int):
+            self.user_history[user.id]["message_id"] = new_message
+            await self.save_state(user)
+
         return new_message
 
     async def _add_roles(self, member, role_names):
@@ -633,8 +696,8 @@ class Welcome(commands.Cog):
 
     async def errorer(self, member: discord.Member):
         menu_name = "choose_path"
-        await self.load_menu(member, menu_name)
         self.user_history[member.id]["history"].append(menu_name)
+        await self.load_menu(member, menu_name)
 
     async def guest(self, member: discord.Member):
         """Add guest role and change nickname to CR"""
@@ -643,7 +706,7 @@ class Welcome(commands.Cog):
         if not member:
             return self.errorer(member)
         try:
-            profiletag = self.tags.getTag(member.id, 1)
+            profiletag = await self.tags.getTag(member.id, 1)
             if profiletag is None:
                 return await self.errorer(member)
             profiledata = await self.clash.get_player(profiletag)
@@ -664,8 +727,8 @@ class Welcome(commands.Cog):
             pass
 
         menu_name = "end_guest"
-        await self.load_menu(member, menu_name)
         self.user_history[member.id]["history"].append(menu_name)
+        await self.load_menu(member, menu_name)
 
     async def verify_membership(self, member:discord.Member):
         guild = self.bot.get_guild(legend_guild_id)
@@ -673,24 +736,24 @@ class Welcome(commands.Cog):
         clans_joined = []
         role_names = []
         ign = None
+        self.load_family_clans()
         try:
-            player_tags = self.tags.getAllTags(member.id)
-            for tag in player_tags:
-                player_data = await self.clash.get_player(tag)
-                if player_data.clan is None:
-                    clantag = ""
-                else:
-                    clantag = player_data.clan.tag.strip("#")
-                for name, data in self.family_clans.items():
-                    if data.get("tag") == clantag:
-                        membership = True
-                        clans_joined.append(data.get("nickname"))
-                        role_names.append(data.get("clanrole"))
-                        break
-                if ign is None:
-                    ign = player_data.name
+            player_tags = await self.tags.getAllTags(member.id)
+            players = await asyncio.gather(*(self.clash.get_player(tag) for tag in player_tags))
         except clashroyale.RequestError:
             return await self.errorer(member)
+        for player_data in players:
+            if player_data.clan is None:
+                clantag = ""
+            else:
+                clantag = player_data.clan.tag.strip("#")
+            data = self.family_clans_by_tag.get(clantag)
+            if data is not None:
+                membership = True
+                clans_joined.append(data.get("nickname"))
+                role_names.append(data.get("clanrole"))
+            if ign is None:
+                ign = player_data.name
 
         if membership:
             try:
@@ -710,36 +773,61 @@ class Welcome(commands.Cog):
             return await self.errorer(member)
 
         menu_name = "give_tags"
-        await self.load_menu(member, menu_name)
         self.user_history[member.id]["history"].append(menu_name)
+        await self.load_menu(member, menu_name)
 
         welcomeMsg = rand_choice(self.welcome["GREETING"])
         channel = self.bot.get_channel(global_chat_id)
         await channel.send(welcomeMsg.format(member))
 
-    async def clans_options(self, user):
+    async def clan_snapshot(self):
+        """Family clans from ClashRoyaleClans2's refreshed data
+
+        None when the cog is not loaded, the data of any family clan is older
+        than the configured maximum age or a family clan is missing.
+        """
+        crclans = self.bot.get_cog("ClashRoyaleClans2")
+        if crclans is None:
+            return None
+        max_age = await self.config.clan_snapshot_max_age()
+        now = datetime.now()
+        snapshot = {}
+        for name, data in (await crclans.all_clans_data()).items():
+            # A clan that keeps failing keeps its old data, judge each on its own
+            updated = crclans.clans_updated.get(name)
+            if updated is not None and (now - updated).total_seconds() <= max_age:
+                snapshot[data["tag"].strip("#")] = data
         clandata = []
+        for data in self.family_clans.values():
+            if data.get("tag") not in snapshot:
+                return None
+            clandata.append(snapshot[data.get("tag")])
+        return clandata
+
+    async def clans_options(self, user):
         options = []
-        for clankey, data in self.family_clans.items():
+        self.load_family_clans()
+        clandata = await self.clan_snapshot()
+        if clandata is None:
             try:
-                clan = await self.clash.get_clan(data.get('tag'))
-                clandata.append(clan)
+                clandata = await asyncio.gather(
+                    *(self.clash.get_clan(data.get('tag')) for data in self.family_clans.values())
+                )
             except clashroyale.RequestError:
                 return await user.dm_channel.send("Error: cannot reach Clash Royale Servers. Please try again later.")
+            clandata = [clan.to_dict() for clan in clandata]
 
-        clandata = sorted(clandata, key=lambda x: (x.required_trophies, x.clan_score), reverse=True)
+        clandata = sorted(clandata, key=lambda x: (x["required_trophies"], x["clan_score"]), reverse=True)
 
         index = 0
         for clan in clandata:
-            clankey = clan.name
-
             member_count = clan.get("members")
             if member_count < 50:
                 showMembers = str(member_count) + "/50"
             else:
                 showMembers = "**FULL**"
 
-            title = "[{}] {} ({}+) ".format(showMembers, clan.name, clan.required_trophies)
+            title = "[{}] {} ({}+) ".format(showMembers, clan["name"], clan["required_trophies"])
 
             options.append({
                 "name": title,
@@ -820,20 +908,20 @@ class Welcome(commands.Cog):
 
         self.joined.append(member.id)
 
+        await self.clear_state(member)
+        self.new_state(member)
         await self.load_menu(member, "main")
 
-        if member.id in self.user_history:
-            del self.user_history[member.id]
-
-        await asyncio.sleep(1200)
+        await asyncio.sleep(menu_timeout)
 
-        if member.id in self.user_history:
+        state = self.user_history.get(member.id)
+        if state is not None and state["history"] != ["main"]:
             return
 
         if member in guild.members:
             menu_name = "leave_alone"
+            self.new_state(member, history=["main", menu_name])
             await self.load_menu(member, menu_name)
-            self.user_history[member.id] = {"history": ["main", menu_name], "data": {}}
 
     @commands.Cog.listener()
     async def on_member_remove(self, member:discord.Member):
@@ -850,16 +938,24 @@ class Welcome(commands.Cog):
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction: discord.Reaction, user: discord.Member):
         if reaction.message.channel.type is discord.ChannelType.private and self.bot.user.id != user.id:
-            if user.id not in self.joined:
-                return
-            history = {"history": ["main"], "data": {}}
-
-            if user.id in self.user_history:
-                history = self.user_history[user.id]
-            else:
-                self.user_history.update({user.id: history})
+            history = await self.get_state(user)
+            if history is None:
+                # Saved states survive restarts, joined only covers this session
+                if user.id not in self.joined:
+                    return
+                history = self.new_state(user)
 
             await self.ReactionAddedHandler(reaction, user, history["history"], history["data"])
+            await self.save_state(user)
+
+    @commands.command()
+    @checks.is_owner()
+    async def welcome_clanmaxage(self, ctx, seconds: int):
+        """Set how old the shared clan data may be for the clan menu"""
+        if seconds < 0:
+            return await ctx.send("The maximum age cannot be negative.")
+        await self.config.clan_snapshot_max_age.set(seconds)
+        await ctx.send(f"The clan menu now uses clan data up to {seconds} seconds old.")
 
     @commands.command()
     @commands.guild_only()
@@ -882,6 +978,9 @@ class Welcome(commands.Cog):
 
         profiletag = self.tags.formatTag(profiletag)
 
+        if await self.get_state(member) is None:
+            self.new_state(member)
+
         if not self.tags.verifyTag(profiletag):
             return await ctx.send("The ID you provided has invalid characters. Please try again.")
 
@@ -899,8 +998,8 @@ class Welcome(commands.Cog):
             await self.tags.saveTag(member.id, profiletag)
 
             menu_name = "choose_path"
-            await self.load_menu(member, menu_name)
             self.user_history[member.id]["history"].append(menu_name)
+            await self.load_menu(member, menu_name)
 
         except clashroyale.NotFoundError:
             return await ctx.send("We cannot find your ID in our database, please try again.")
@@ -908,5 +1007,5 @@ class Welcome(commands.Cog):
             return await ctx.send("Error: cannot reach Clash Royale Servers. Please try again later.")
         except:
             menu_name = "choose_path"
-            await self.load_menu(member, menu_name)
             self.user_history[member.id]["history"].append(menu_name)
+            await self.load_menu(member, menu_name)